@@ -1,56 +1,610 @@
 
+from __future__ import annotations
+
 import os
 import re
 import fnmatch
 import math
+import json
+import csv
+import hashlib
+import struct
+import random
+import shutil
+import statistics
+import time
 import sqlite3
 import logging
-from typing import Optional
+import argparse
+import sys
+import functools
+import itertools
+import subprocess
+import threading
+import contextlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional
 import ffmpeg
-import flet as ft
+try:
+    import flet as ft
+except ImportError:  # 命令行模式不需要界面库
+    ft = None
 
 # 常量定义
 ID_PATTERN = re.compile(r'([a-zA-Z]{2,5})(-|00)?(\d{2,5})')  # 恢复常量定义
-VIDEO_EXTENSIONS = ('*.mp4', '*.mkv', '*.avi')               # 恢复常量定义
+ID_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'id_rules.json')  # ID提取规则配置
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'avid.db')  # 默认数据库（与程序同目录，不随当前目录变化）
+DB_POOL_SIZE = 4                                             # 连接池中保留的空闲连接数
+DB_CACHE_KB = 64 * 1024                                      # 每个连接的页缓存大小（KB）
+DB_MMAP_SIZE = 256 * 1024 * 1024                             # 内存映射读取的最大字节数
+DB_STATEMENT_CACHE = 256                                     # 每个连接缓存的预编译语句数
+ID_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'id_corpus.tsv')  # ID提取测试语料
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.mkv', '.avi', '.ts', '.wmv', '.m2ts'})  # 视频扩展名（不区分大小写）
+PROBE_CACHE_MAX_ENTRIES = 200000                             # 探测缓存最大条目数
+PROBE_CACHE_MAX_AGE = 180 * 24 * 3600                        # 探测缓存最长保留时间（秒）
+PROBE_WORKERS = min(32, (os.cpu_count() or 1) * 2)           # 并行探测的最大线程数
+PROBE_TIMEOUT = 60                                           # 单个文件探测超时（秒）
+SQL_IN_CHUNK = 500                                           # IN (...) 查询每批参数个数
+PAGE_SIZE = 100                                              # 表格每页显示的行数
+PROGRESS_INTERVAL = 0.1                                      # 进度刷新最小间隔（秒），即每秒最多10次
+PARTIAL_BATCH = 200                                          # 扫描过程中每完成多少个文件刷新一次部分结果
+PROBE_TIMEOUT_GRACE = 5                                      # 超过 timeout 该秒数仍未完成的任务（如卡住的网络盘读取）记为失败
+PROBE_MAX_PENDING = PROBE_WORKERS * 4                        # 同时排队的探测任务上限，限制大目录的内存占用
+FAST_PROBE = True                                            # 优先直接解析 MP4/MKV 文件头，失败再调用 ffprobe
+MP4_MOOV_LIMIT = 64 * 1024 * 1024                            # MP4 moov 头的最大读取字节数
+MKV_HEADER_LIMIT = 2 * 1024 * 1024                           # MKV 文件头（Info/Tracks）的最大读取字节数
+FINGERPRINT_CHUNK = 1024 * 1024                              # 指纹取样块大小：文件头、中、尾各读取一块
+HASH_WORKERS = 2                                             # 同时计算指纹的最大线程数，避免占满磁盘带宽
+RENAME_WORKERS = 8                                           # 并行执行重命名的目录数（同一目录内按顺序执行）
+RENAME_JOURNAL_DIR = 'rename_journal'                        # 重命名撤销日志目录名（位于当前数据库文件所在目录）
+QUALITY_MARGIN = 1.15                                        # 分辨率/有效码率至少高出该比例才算画质不同，避免码率小幅波动被当成升级
+DURATION_TOLERANCE = 0.02                                    # 时长相差超过该比例（且超过 DURATION_MIN_DIFF 秒）视为不同版本
+DURATION_MIN_DIFF = 5                                        # 时长允许的最小误差（秒）
+CODEC_EFFICIENCY = {'av1': 2.0, 'hevc': 1.6, 'vp9': 1.5, 'h264': 1.0, 'vc1': 0.8, 'wmv3': 0.7,
+                    'mpeg4': 0.7, 'msmpeg4v3': 0.6, 'mpeg2video': 0.5}  # 编码效率系数（相对 h264），未知编码按 1.0 计
+SEARCH_FACET_LIMIT = 50                                      # 每个分面最多返回的取值个数（按数量降序）
+SEARCH_SORT_LIMIT = 5000                                     # 检索命中不超过该数量时按筛选条件取数再排序，否则沿排序索引取数
+PROFILE_ENV = 'AVID_PROFILE'                                 # 界面模式开启性能统计的环境变量
+BENCH_DIR = '.bench'                                         # 基准测试目录树中存放模板、清单和数据库的子目录
+BENCH_TEMPLATES = (('mp4', 'libx264', 1920, 1080), ('mp4', 'libx264', 1280, 720), ('mp4', 'mpeg4', 640, 480),
+                   ('mkv', 'libx265', 1920, 1080), ('mkv', 'libx264', 3840, 2160))  # 基准测试视频模板：(容器, 编码, 宽, 高)
+BENCH_STUDIOS = ('ABP', 'SSIS', 'IPX', 'MIDE', 'STARS', 'PRED', 'JUL', 'HMN', 'FSDSS', 'CAWD')
+BENCH_NAME_STYLES = ('{studio}-{number:03d}', '{studio}{number:05d}', '[site.com]{studio}-{number:03d}',
+                     'hhd800.com@{studio}-{number:03d}', '{studio}-{number:03d}-C', '{studio}-{number:03d}-UC',
+                     '{studio}-{number:03d} 1080p')  # 基准测试文件名样式，覆盖常见的噪声和后缀
+REENCODE_CODECS = ('h264',)                                   # 转码候选的视频编码
+REENCODE_MIN_BITRATE = 6_000_000                             # 码率不低于该值（bps）才列为转码候选
+REENCODE_TARGET = 'hevc'                                     # 估算转码节省空间时的目标编码
+QUALITY_LABELS = {'upgrade': '升级', 'downgrade': '较差', 'same': '相同', 'mismatch': '时长不符',
+                  'inferior': '非最佳副本'}                   # 画质对比结论的显示文本
+MP4_CODECS = {b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc',
+              b'av01': 'av1', b'vp09': 'vp9', b'mp4v': 'mpeg4'}  # MP4 样本格式 → ffprobe 编码名
+MKV_CODECS = {'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc', 'V_AV1': 'av1', 'V_VP9': 'vp9',
+              'V_VP8': 'vp8', 'V_MPEG4/ISO/ASP': 'mpeg4', 'V_MPEG4/ISO/SP': 'mpeg4',
+              'V_MPEG2': 'mpeg2video'}                       # MKV CodecID → ffprobe 编码名
 
-# 日志配置（必须在函数定义前初始化）
+# 日志配置（处理器在 setup_logging 中添加，导入模块时不创建日志文件）
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('avid.log', mode='a')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+
+def setup_logging(log_file: Optional[str] = 'avid.log') -> None:
+    """添加文件和控制台日志处理器（控制台输出到 stderr，不影响命令行的 JSON 输出）"""
+    if logger.handlers:
+        return
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    if log_file:
+        file_handler = logging.FileHandler(log_file, mode='a')
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+
+# 性能统计 --------------------------------------------------
+class Profiler:
+    """
+    可选的性能统计：按阶段记录每次耗时（用于总耗时和 p50/p95/p99 分位数），另有计数器
+    默认关闭，关闭时各埋点只多一次属性判断；开启后每次运行（命令行命令或界面任务）结束时
+    输出一行 JSON 汇总，写入 avid.log 日志或单独的指标文件（JSON Lines）
+    同时运行的多个任务共用一份统计，最后一个结束时输出
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics_file = None
+        self.last_summary = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._reset(None)
+
+    def enable(self, metrics_file: Optional[str] = None) -> None:
+        """开启统计，metrics_file 为空时汇总写入日志"""
+        self.enabled = True
+        self.metrics_file = metrics_file or None
+
+    def _reset(self, name: Optional[str]) -> None:
+        self.run_name = name
+        self.started = time.perf_counter()
+        self.samples = {}
+        self.totals = {}
+        self.counters = {}
+
+    def record(self, name: str, seconds: float, sample: bool = True) -> None:
+        """累计某个阶段的一次耗时；sample 为 False 时只计入总耗时"""
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            if sample:
+                self.samples.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """统计一段代码的耗时"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        """统计从（生成器）迭代器逐个取值的耗时，不包括调用方处理每个值的时间"""
+        if not self.enabled:
+            return iterable
+        return self._iterate(name, iter(iterable))
+
+    def _iterate(self, name: str, iterator: Iterator) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start, sample=False)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield value
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """返回统计耗时的包装函数（用于 page.update 等无法加装饰器的方法）"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    @contextlib.contextmanager
+    def run(self, name: str) -> Iterator[None]:
+        """一次运行的边界：开始时清空统计，结束时输出汇总"""
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            if self._active == 0:
+                self._reset(name)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                finished = self._active == 0
+            if finished:
+                self.emit(self.summary())
+
+    def summary(self) -> dict:
+        """汇总：总耗时、文件吞吐量、数据库耗时、界面刷新次数及各阶段的次数/总耗时/分位数（毫秒）"""
+        with self._lock:
+            wall = time.perf_counter() - self.started
+            samples = {name: list(values) for name, values in self.samples.items()}
+            totals = dict(self.totals)
+            counters = dict(self.counters)
+        stages = {}
+        for name, total in sorted(totals.items()):
+            values = samples.get(name, [])
+            stage = {'count': len(values), 'total_ms': round(total * 1000, 3)}
+            if values:
+                if len(values) > 1:
+                    cuts = statistics.quantiles(values, n=100, method='inclusive')
+                    p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+                else:
+                    p50 = p95 = p99 = values[0]
+                stage.update({'p50_ms': round(p50 * 1000, 3), 'p95_ms': round(p95 * 1000, 3),
+                              'p99_ms': round(p99 * 1000, 3), 'max_ms': round(max(values) * 1000, 3)})
+            stages[name] = stage
+        files = counters.get('files', 0)
+        return {
+            'event': 'profile',
+            'run': self.run_name,
+            'wall_s': round(wall, 3),
+            'files': files,
+            'files_per_s': round(files / wall, 1) if wall > 0 else 0.0,
+            'mb_per_s': round(counters.get('bytes', 0) / 1024 / 1024 / wall, 1) if wall > 0 else 0.0,
+            'db_ms': round(sum(stage['total_ms'] for name, stage in stages.items() if name.startswith('db.')), 3),
+            'ui_updates': stages.get('ui.update', {}).get('count', 0),
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def emit(self, summary: dict) -> None:
+        """把汇总写入指标文件（追加一行 JSON），未指定文件时写入日志"""
+        self.last_summary = summary
+        line = json.dumps(summary, ensure_ascii=False)
+        if self.metrics_file:
+            with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        else:
+            logger.info("性能统计: %s", line)
+
+profiler = Profiler()
+
+def timed(name: str) -> Callable:
+    """装饰器：开启性能统计时记录函数每次调用的耗时"""
+    def decorator(func: Callable) -> Callable:
+        return profiler.wrap(name, func)
+    return decorator
 
 # 工具函数 --------------------------------------------------
+def iter_video_files(
+    directory: str,
+    extensions: Iterable[str] = VIDEO_EXTENSIONS,
+    max_depth: Optional[int] = None,
+    excludes: Iterable[str] = ()
+) -> Iterator[str]:
+    """
+    基于 os.scandir 单次遍历目录，边遍历边返回视频文件路径
+    extensions: 扩展名集合（含点号，不区分大小写）
+    max_depth: 最大递归深度，0 表示只扫描顶层目录，None 表示不限制
+    excludes: 需要跳过的文件/目录名通配符，例如 ('@eaDir', '*.part')
+    """
+    extensions = {ext.lower() for ext in extensions}
+    excludes = tuple(excludes)
+    stack = [(directory, 0)]
+    while stack:
+        current, depth = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if excludes and any(fnmatch.fnmatch(entry.name, pattern) for pattern in excludes):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if max_depth is None or depth < max_depth:
+                                subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in extensions:
+                            yield entry.path
+                    except OSError as e:
+                        logger.warning("无法访问: %s %s", entry.path, str(e))
+        except OSError as e:
+            logger.warning("无法读取目录: %s %s", current, str(e))
+            continue
+        # 逆序入栈，保持与 os.walk 相同的目录访问顺序
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+
 def find_video_files(directory: str) -> list:
     """查找目录下的视频文件"""
-    return [
-        os.path.join(root, filename)
-        for root, _, files in os.walk(directory)
-        for ext in VIDEO_EXTENSIONS
-        for filename in fnmatch.filter(files, ext)
-    ]
+    return list(profiler.iterate('walk', iter_video_files(directory)))
+
+class IdExtractor:
+    """
+    电影ID提取器，规则来自 id_rules.json，构造时一次性编译：
+    - noise: 需要先从文件名中移除的域名/广告字符串
+    - patterns: 按优先级排列的ID规则，format 中 {n} 为第n个分组，upper 表示结果转大写
+    - suffixes: 文件主名后缀规则（如 -C / -UC 对应新文件名中的 -C）
+    """
+
+    def __init__(self, rules: dict):
+        noise = rules.get('noise', [])
+        self.noise = re.compile("|".join(map(re.escape, noise)), re.IGNORECASE) if noise else None
+        self.patterns = [
+            (rule.get('name', ''), re.compile(rule['regex']), rule['format'], rule.get('upper', False))
+            for rule in rules.get('patterns', [])
+        ]
+        self.suffixes = [(re.compile(rule['regex']), rule['suffix']) for rule in rules.get('suffixes', [])]
+
+    def extract(self, input_string: str) -> Optional[str]:
+        """从文件名中提取电影ID，无法识别时返回 None"""
+        string = self.noise.sub("", input_string) if self.noise else input_string
+        for _, pattern, template, upper in self.patterns:
+            match = pattern.search(string)
+            if match:
+                movie_id = template.format(match.group(0), *match.groups())
+                return movie_id.upper() if upper else movie_id
+        return None
+
+    def extract_ids(self, names: Iterable[str]) -> list:
+        """批量提取电影ID，无法识别的为 None"""
+        return [self.extract(name) for name in names]
+
+    def suffix(self, main_name: str) -> str:
+        """根据文件主名（不含扩展名）返回新文件名需要保留的后缀"""
+        for pattern, suffix in self.suffixes:
+            if pattern.search(main_name):
+                return suffix
+        return ""
 
+@functools.lru_cache(maxsize=None)
+def load_id_extractor(path: str = ID_RULES_PATH) -> IdExtractor:
+    """读取并编译ID提取规则（结果会被缓存），配置文件缺失时只使用 ID_PATTERN"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            rules = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("无法读取ID规则配置 %s，使用默认规则: %s", path, str(e))
+        rules = {'patterns': [{'name': 'standard', 'regex': ID_PATTERN.pattern, 'format': '{1}-{3}', 'upper': True}]}
+    return IdExtractor(rules)
+
+@timed('find_id')
 def find_id(input_string: str) -> str:
-    """从文件名中提取电影ID"""
-    # 需要移除的字符串列表
-    DOMAINS_TO_REMOVE = ["hhd800.com", "hjd2048.com", "zzpp01.com", "zzpp06.com", "bo99.tv","zzpp03.com","bbs2048.org","big2048.com","avav55.xyz","ddr91","aavv121.com","dioguitar23","yjs521","zzpp08.com"]
-    # 使用正则表达式一次性替换所有域名
-    pattern = "|".join(map(re.escape, DOMAINS_TO_REMOVE))
-    string = re.sub(pattern, "", input_string)
-    match = ID_PATTERN.search(string)
-    return f"{match.group(1).upper()}-{match.group(3)}" if match else input_string
-
-def get_video_info(video_path: str, logger) -> Optional[dict]:
-    """获取视频文件的元数据信息"""
+    """从文件名中提取电影ID，无法识别时原样返回（界面和数据库中仍以文件名作为ID）"""
+    return load_id_extractor().extract(input_string) or input_string
+
+def extract_ids(names: Iterable[str]) -> list:
+    """批量从文件名中提取电影ID，无法识别的为 None"""
+    return load_id_extractor().extract_ids(names)
+
+def find_suffix(main_name: str) -> str:
+    """根据文件主名返回新文件名的后缀（如 -C）"""
+    return load_id_extractor().suffix(main_name)
+
+def benchmark_id_extraction(corpus_path: str = ID_CORPUS_PATH, rounds: int = 1000) -> dict:
+    """
+    使用语料（每行: 文件名<TAB>期望ID，# 开头为注释）评估ID提取的准确率和速度
+    返回：{'names': 条数, 'accuracy': 准确率, 'misses': [(文件名, 期望, 实际)], 'us_per_name': 每条耗时(微秒)}
+    """
+    with open(corpus_path, encoding='utf-8') as f:
+        corpus = [line.rstrip('\n').split('\t') for line in f if line.strip() and not line.startswith('#')]
+    names = [name for name, _ in corpus]
+    extractor = load_id_extractor()
+    results = extractor.extract_ids(names)
+    misses = [(name, expected, actual) for (name, expected), actual in zip(corpus, results) if expected != actual]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extractor.extract_ids(names)
+    elapsed = time.perf_counter() - start
+    return {
+        'names': len(names),
+        'accuracy': 1 - len(misses) / len(names) if names else 0.0,
+        'misses': misses,
+        'us_per_name': elapsed / (rounds * len(names)) * 1e6 if names else 0.0,
+    }
+
+def _iter_mp4_boxes(data: bytes, start: int, end: int) -> Iterator[tuple]:
+    """遍历 MP4 box，返回 (类型, 内容起点, 内容终点)"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f"损坏的 MP4 box: {box_type!r}")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+def _find_mp4_box(data: bytes, start: int, end: int, path: tuple) -> Optional[tuple]:
+    """按路径查找子 box，返回 (内容起点, 内容终点)"""
+    for box_type, body, box_end in _iter_mp4_boxes(data, start, end):
+        if box_type == path[0]:
+            return (body, box_end) if len(path) == 1 else _find_mp4_box(data, body, box_end, path[1:])
+    return None
+
+def _read_mp4_info(f, file_size: int) -> Optional[dict]:
+    """解析 MP4 的 moov/mvhd/trak(tkhd, mdhd, stsd, stsz)，只读取 moov 部分"""
+    pos = 0
+    moov = None
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        size, box_type = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_size:
+            return None
+        if box_type == b'moov':
+            if size > MP4_MOOV_LIMIT:
+                return None
+            f.seek(pos + header_size)
+            moov = f.read(size - header_size)
+            break
+        pos += size
+    if moov is None:
+        return None
+
+    mvhd = _find_mp4_box(moov, 0, len(moov), (b'mvhd',))
+    if mvhd is None:
+        return None
+    if moov[mvhd[0]] == 1:
+        timescale, duration = struct.unpack_from('>IQ', moov, mvhd[0] + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', moov, mvhd[0] + 12)
+    if not timescale or not duration:
+        return None  # 分片 MP4 等情况交给 ffprobe
+
+    for box_type, body, box_end in _iter_mp4_boxes(moov, 0, len(moov)):
+        if box_type != b'trak':
+            continue
+        hdlr = _find_mp4_box(moov, body, box_end, (b'mdia', b'hdlr'))
+        if hdlr is None or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        stsd = _find_mp4_box(moov, body, box_end, (b'mdia', b'minf', b'stbl', b'stsd'))
+        stsz = _find_mp4_box(moov, body, box_end, (b'mdia', b'minf', b'stbl', b'stsz'))
+        mdhd = _find_mp4_box(moov, body, box_end, (b'mdia', b'mdhd'))
+        if stsd is None or stsz is None or mdhd is None:
+            return None
+        # stsd 第一个样本描述：VisualSampleEntry 中宽高位于第 32/34 字节
+        entry = stsd[0] + 8
+        sample_format = moov[entry + 4:entry + 8]
+        width, height = struct.unpack_from('>HH', moov, entry + 32)
+        # stsz：固定样本大小或逐个样本大小，用于计算视频流码率（与 ffprobe 一致）
+        sample_size, sample_count = struct.unpack_from('>II', moov, stsz[0] + 4)
+        if sample_size:
+            stream_bytes = sample_size * sample_count
+        else:
+            stream_bytes = sum(struct.unpack_from(f'>{sample_count}I', moov, stsz[0] + 12))
+        if moov[mdhd[0]] == 1:
+            track_timescale, track_duration = struct.unpack_from('>IQ', moov, mdhd[0] + 20)
+        else:
+            track_timescale, track_duration = struct.unpack_from('>II', moov, mdhd[0] + 12)
+        track_seconds = track_duration / track_timescale if track_timescale else 0
+        return {
+            'video_duration': duration / timescale,
+            'video_codec_name': MP4_CODECS.get(sample_format, sample_format.decode('latin-1').strip()),
+            'video_width': width,
+            'video_height': height,
+            'file_size': file_size,
+            'file_format': 'mov,mp4,m4a,3gp,3g2,mj2',
+            'video_bitrate': int(stream_bytes * 8 / track_seconds) if track_seconds else 0,
+        }
+    return None
+
+def _read_ebml_vint(data: bytes, pos: int, keep_marker: bool = False) -> tuple:
+    """读取 EBML 变长整数，返回 (值, 字节数, 是否为未知长度)"""
+    first = data[pos]
+    if first == 0:
+        raise ValueError("无效的 EBML 变长整数")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if pos + length > len(data):
+        raise ValueError("EBML 数据不完整")
+    return value, length, not keep_marker and value == (1 << (7 * length)) - 1
+
+def _iter_ebml(data: bytes, start: int, end: int) -> Iterator[tuple]:
+    """遍历 EBML 元素，返回 (元素ID, 内容起点, 内容终点)；终点可能超出已读取的数据"""
+    pos = start
+    while pos < min(end, len(data)):
+        element_id, id_length, _ = _read_ebml_vint(data, pos, keep_marker=True)
+        size, size_length, unknown = _read_ebml_vint(data, pos + id_length)
+        body = pos + id_length + size_length
+        element_end = end if unknown else body + size
+        yield element_id, body, element_end
+        pos = element_end
+
+def _read_mkv_info(f, file_size: int) -> Optional[dict]:
+    """解析 Matroska 的 Segment/Info 和 Segment/Tracks，只读取文件开头部分"""
+    data = f.read(MKV_HEADER_LIMIT)
+    segment = next(((body, end) for element_id, body, end in _iter_ebml(data, 0, len(data))
+                    if element_id == 0x18538067), None)
+    if segment is None:
+        return None
+    timecode_scale = 1000000
+    duration = None
+    video = None
+    for element_id, body, end in _iter_ebml(data, *segment):
+        if element_id == 0x1F43B675:  # Cluster：文件头结束
+            break
+        if element_id not in (0x1549A966, 0x1654AE6B):
+            continue
+        if end > len(data):
+            return None
+        if element_id == 0x1549A966:  # Info
+            for child_id, child, child_end in _iter_ebml(data, body, end):
+                if child_id == 0x2AD7B1:  # TimecodeScale
+                    timecode_scale = int.from_bytes(data[child:child_end], 'big')
+                elif child_id == 0x4489:  # Duration
+                    duration = struct.unpack('>f' if child_end - child == 4 else '>d', data[child:child_end])[0]
+        else:  # Tracks
+            for entry_id, entry, entry_end in _iter_ebml(data, body, end):
+                if entry_id != 0xAE or video is not None:  # TrackEntry
+                    continue
+                track = {}
+                for child_id, child, child_end in _iter_ebml(data, entry, entry_end):
+                    if child_id == 0x83:  # TrackType
+                        track['type'] = int.from_bytes(data[child:child_end], 'big')
+                    elif child_id == 0x86:  # CodecID
+                        track['codec'] = data[child:child_end].decode('ascii', 'replace').rstrip('\x00')
+                    elif child_id == 0xE0:  # Video
+                        for video_id, value, value_end in _iter_ebml(data, child, child_end):
+                            if video_id == 0xB0:  # PixelWidth
+                                track['width'] = int.from_bytes(data[value:value_end], 'big')
+                            elif video_id == 0xBA:  # PixelHeight
+                                track['height'] = int.from_bytes(data[value:value_end], 'big')
+                if track.get('type') == 1:
+                    video = track
+    if duration is None or video is None:
+        return None
+    return {
+        'video_duration': duration * timecode_scale / 1e9,
+        'video_codec_name': MKV_CODECS.get(video.get('codec'), video.get('codec')),
+        'video_width': video.get('width', 0),
+        'video_height': video.get('height', 0),
+        'file_size': file_size,
+        'file_format': 'matroska,webm',
+        'video_bitrate': 0,  # 与 ffprobe 一致：MKV 视频流没有码率字段
+    }
+
+@timed('probe.header')
+def read_header_info(video_path: str) -> Optional[dict]:
+    """
+    不启动 ffprobe，直接解析 MP4/MKV 文件头获取元数据，返回与 get_video_info 相同结构的字典
+    只读取 moov 或 Info/Tracks 部分；不支持的格式或解析失败时返回 None
+    """
+    try:
+        with open(video_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            magic = f.read(12)
+            f.seek(0)
+            if magic[4:8] == b'ftyp':
+                return _read_mp4_info(f, file_size)
+            if magic[:4] == b'\x1a\x45\xdf\xa3':
+                return _read_mkv_info(f, file_size)
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        logger.debug("文件头解析失败，改用ffprobe: %s %s", video_path, str(e))
+    return None
+
+def run_ffprobe(video_path: str, timeout: Optional[float] = None) -> dict:
+    """
+    直接调用 ffprobe 读取容器和流信息，超时抛出 subprocess.TimeoutExpired（子进程会被终止）
+    ffmpeg.probe 会把多余的关键字参数转换成命令行选项，无法用来设置超时
+    """
+    result = subprocess.run(['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', video_path],
+                            capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise ffmpeg.Error('ffprobe', result.stdout, result.stderr)
+    return json.loads(result.stdout.decode('utf-8', errors='replace'))
+
+@timed('probe')
+def get_video_info(video_path: str, logger, timeout: Optional[float] = None) -> Optional[dict]:
+    """获取视频文件的元数据信息，timeout 为整个探测（文件头解析 + ffprobe）的时间预算"""
+    started = time.monotonic()
     try:
         if not os.path.exists(video_path):
             logger.warning("文件不存在: %s", video_path)
             return None
-            
-        probe = ffmpeg.probe(video_path)
+
+        if FAST_PROBE:
+            info = read_header_info(video_path)
+            if info is not None:
+                return info
+
+        if timeout is not None:
+            # 文件头读取（如网络盘）占用的时间从 ffprobe 的超时中扣除
+            timeout -= time.monotonic() - started
+            if timeout <= 0:
+                raise subprocess.TimeoutExpired('ffprobe', 0)
+        with profiler.stage('probe.ffprobe'):
+            probe = run_ffprobe(video_path, timeout)
         video_info = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
         audio_info = next((stream for stream in probe['streams'] if stream['codec_type'] == 'audio'), None)
 
@@ -84,11 +638,703 @@ def get_video_info(video_path: str, logger) -> Optional[dict]:
         }
         return info
     except ffmpeg.Error as e:
-        logger.error("FFmpeg探测错误: %s", str(e))
+        logger.error("FFmpeg探测错误: %s %s", video_path, e.stderr.decode('utf-8', errors='replace').strip()
+                     if isinstance(getattr(e, 'stderr', None), bytes) else str(e))
+    except ValueError as e:
+        logger.error("FFmpeg输出无法解析: %s %s", video_path, str(e))
     except FileNotFoundError:
-        logger.error("文件未找到: %s", video_path)
+        logger.error("文件或 ffprobe 程序未找到: %s", video_path)
+    except subprocess.TimeoutExpired:
+        logger.error("FFmpeg探测超时: %s", video_path)
     return None
 
+# videos 表的全文索引同步触发器（重建 videos 表后需要重新创建）
+VIDEOS_FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+                        INSERT INTO videos_fts (rowid, id, filename) VALUES (new.sn, new.id, new.filename);
+                        END''',
+    '''CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+                        INSERT INTO videos_fts (videos_fts, rowid, id, filename) VALUES ('delete', old.sn, old.id, old.filename);
+                        END''',
+    '''CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF id, filename ON videos BEGIN
+                        INSERT INTO videos_fts (videos_fts, rowid, id, filename) VALUES ('delete', old.sn, old.id, old.filename);
+                        INSERT INTO videos_fts (rowid, id, filename) VALUES (new.sn, new.id, new.filename);
+                        END''',
+]
+
+SEARCH_FACETS = ('studio', 'codec', 'res_class', 'chs')
+
+def _facet_count_statements(row: str, delta: int) -> str:
+    """生成触发器中按 row（new/old）记录的各分面取值调整 video_facets 计数的语句，取值可能为 NULL，按 IS 匹配"""
+    statements = []
+    for facet in SEARCH_FACETS:
+        if delta > 0:
+            statements.append(
+                f"INSERT INTO video_facets (facet, value, count) SELECT '{facet}', {row}.{facet}, 0 "
+                f"WHERE NOT EXISTS (SELECT 1 FROM video_facets WHERE facet = '{facet}' AND value IS {row}.{facet});")
+        statements.append(
+            f"UPDATE video_facets SET count = count + {delta} WHERE facet = '{facet}' AND value IS {row}.{facet};")
+    return '\n'.join(statements)
+
+# 全库分面计数（video_facets）的同步触发器，未筛选的检索直接读取计数，不扫描全表（重建 videos 表后需要重新创建）
+VIDEOS_FACET_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS videos_facets_insert AFTER INSERT ON videos BEGIN
+                        {_facet_count_statements('new', 1)}
+                        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS videos_facets_delete AFTER DELETE ON videos BEGIN
+                        {_facet_count_statements('old', -1)}
+                        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS videos_facets_update AFTER UPDATE OF id, codec, chs, height ON videos
+                        WHEN {' OR '.join(f'old.{facet} IS NOT new.{facet}' for facet in SEARCH_FACETS)} BEGIN
+                        {_facet_count_statements('old', -1)}
+                        {_facet_count_statements('new', 1)}
+                        END''',
+]
+
+# 数据库结构迁移，按 PRAGMA user_version 依次执行，序号即版本号
+SCHEMA_MIGRATIONS = [
+    # 1: 基础表结构；去除重复ID（保留最新记录）后为 id 建唯一索引，并为常用筛选列建索引
+    [
+        '''CREATE TABLE IF NOT EXISTS videos
+                        (sn INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT, filename TEXT, size REAL, 
+                        resolution TEXT, duration REAL, 
+                        codec TEXT, bitrate INTEGER,
+                        chs BOOLEAN)''',
+        "DELETE FROM videos WHERE sn NOT IN (SELECT MAX(sn) FROM videos GROUP BY id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_videos_id ON videos(id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_codec ON videos(codec)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_resolution ON videos(resolution)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_chs ON videos(chs)",
+    ],
+    # 2: 增量扫描用的目录快照，scope 区分不同页面各自的上次扫描结果
+    [
+        '''CREATE TABLE IF NOT EXISTS scan_snapshot
+                        (scope TEXT, root TEXT, path TEXT,
+                        inode INTEGER, size INTEGER, mtime_ns INTEGER,
+                        PRIMARY KEY (scope, root, path))''',
+    ],
+    # 3: 内容指纹（大小 + 头/中/尾取样哈希）及文件头取样哈希，用于查找重复文件
+    [
+        "ALTER TABLE videos ADD COLUMN fingerprint TEXT",
+        "ALTER TABLE videos ADD COLUMN fp_head TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_videos_fingerprint ON videos(fingerprint)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_fp_head ON videos(fp_head)",
+    ],
+    # 4: 文件的绝对路径及所在卷（盘符、网络共享或挂载点），重命名/移动后同步更新
+    [
+        "ALTER TABLE videos ADD COLUMN path TEXT",
+        "ALTER TABLE videos ADD COLUMN volume TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_videos_path ON videos(path)",
+    ],
+    # 5: 检索用的片商前缀、分辨率等级（由 id/resolution 生成的虚拟列）、分面统计用的覆盖索引，
+    #    以及 id/filename 全文索引，触发器保持全文索引同步
+    [
+        '''ALTER TABLE videos ADD COLUMN studio TEXT GENERATED ALWAYS AS
+                        (CASE WHEN id GLOB '[A-Za-z]*-*' THEN upper(substr(id, 1, instr(id, '-') - 1)) END) VIRTUAL''',
+        '''ALTER TABLE videos ADD COLUMN res_class TEXT GENERATED ALWAYS AS
+                        (CASE WHEN CAST(substr(resolution, instr(resolution, 'x') + 1) AS INTEGER) >= 2000 THEN '2160p'
+                              WHEN CAST(substr(resolution, instr(resolution, 'x') + 1) AS INTEGER) >= 1000 THEN '1080p'
+                              WHEN CAST(substr(resolution, instr(resolution, 'x') + 1) AS INTEGER) >= 700 THEN '720p'
+                              ELSE 'SD' END) VIRTUAL''',
+        "CREATE INDEX IF NOT EXISTS idx_videos_facets ON videos(studio, codec, chs, res_class, size, duration)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_size ON videos(size)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_duration ON videos(duration)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_bitrate ON videos(bitrate)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_width ON videos(CAST(resolution AS INTEGER))",
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5
+                        (id, filename, content='videos', content_rowid='sn', prefix='2 3')''',
+        *VIDEOS_FTS_TRIGGERS,
+        "INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')",
+    ],
+    # 6: 类型化存储：大小存字节数，分辨率拆为宽、高整数，时长存秒数；旧数据按原格式换算后重建表和索引
+    [
+        '''CREATE TABLE videos_typed
+                        (sn INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT, filename TEXT, size INTEGER,
+                        width INTEGER, height INTEGER, duration REAL,
+                        codec TEXT, bitrate INTEGER, chs BOOLEAN,
+                        fingerprint TEXT, fp_head TEXT, path TEXT, volume TEXT,
+                        studio TEXT GENERATED ALWAYS AS
+                            (CASE WHEN id GLOB '[A-Za-z]*-*' THEN upper(substr(id, 1, instr(id, '-') - 1)) END) VIRTUAL,
+                        res_class TEXT GENERATED ALWAYS AS
+                            (CASE WHEN height >= 2000 THEN '2160p' WHEN height >= 1000 THEN '1080p'
+                                  WHEN height >= 700 THEN '720p' ELSE 'SD' END) VIRTUAL)''',
+        # size 原为四舍五入到 0.01 的 MB 数；resolution 为 "宽x高"；duration 为 "时:分:秒" 文本
+        '''INSERT INTO videos_typed
+                        (sn, id, filename, size, width, height, duration, codec, bitrate, chs,
+                        fingerprint, fp_head, path, volume)
+                        SELECT sn, id, filename, CAST(ROUND(size * 1048576) AS INTEGER),
+                        CAST(resolution AS INTEGER),
+                        CAST(substr(resolution, instr(resolution, 'x') + 1) AS INTEGER),
+                        CASE WHEN typeof(duration) = 'text' AND duration LIKE '%:%:%' THEN
+                            CAST(substr(duration, 1, instr(duration, ':') - 1) AS INTEGER) * 3600
+                            + CAST(substr(duration, instr(duration, ':') + 1, 2) AS INTEGER) * 60
+                            + CAST(substr(duration, instr(duration, ':') + 4) AS REAL)
+                        ELSE CAST(duration AS REAL) END,
+                        codec, bitrate, chs, fingerprint, fp_head, path, volume
+                        FROM videos''',
+        "DROP TABLE videos",
+        "ALTER TABLE videos_typed RENAME TO videos",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_videos_id ON videos(id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_codec ON videos(codec)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_chs ON videos(chs)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_fingerprint ON videos(fingerprint)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_fp_head ON videos(fp_head)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_path ON videos(path)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_facets ON videos(studio, codec, chs, res_class, size, duration)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_size ON videos(size)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_duration ON videos(duration)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_bitrate ON videos(bitrate)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_width ON videos(width)",
+        *VIDEOS_FTS_TRIGGERS,
+        "INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')",
+    ],
+    # 7: 统计报表用的索引：按编码分组汇总、按编码+码率查找转码候选都走 idx_videos_codec_stats（替代原来的单列编码索引），
+    #    分辨率等级按 idx_videos_res_stats 顺序分组，不需要临时 B 树
+    [
+        "CREATE INDEX IF NOT EXISTS idx_videos_codec_stats ON videos(codec, bitrate, size, duration)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_res_stats ON videos(res_class, size, duration)",
+        "DROP INDEX IF EXISTS idx_videos_codec",
+    ],
+    # 8: 探测缓存表（此前由 ProbeCache 在打开时创建，已有该表的数据库保持不变）
+    [
+        '''CREATE TABLE IF NOT EXISTS probe_cache
+                        (path TEXT PRIMARY KEY,
+                        size INTEGER, mtime_ns INTEGER,
+                        info TEXT, probed_at REAL)''',
+    ],
+    # 9: 全库分面计数，由触发器随 videos 的增删改同步，未筛选的检索（检索页的默认查询）直接读取
+    [
+        "CREATE TABLE IF NOT EXISTS video_facets (facet TEXT NOT NULL, value, count INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_video_facets ON video_facets(facet, value)",
+        "DELETE FROM video_facets",
+        *(f"INSERT INTO video_facets (facet, value, count) SELECT '{facet}', {facet}, COUNT(*) FROM videos GROUP BY {facet}"
+          for facet in SEARCH_FACETS),
+        *VIDEOS_FACET_TRIGGERS,
+    ],
+]
+
+# videos 表的列（不含生成列），查询时按此顺序取列，record_from_row 按此顺序转换
+VIDEO_COLUMNS = ('sn', 'id', 'filename', 'size', 'width', 'height', 'duration', 'codec', 'bitrate', 'chs',
+                 'fingerprint', 'fp_head', 'path', 'volume')
+
+def migrate_db(conn: sqlite3.Connection) -> int:
+    """
+    将数据库结构升级到最新版本
+    返回：迁移后的版本号
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            for statement in statements:
+                cursor = conn.execute(statement)
+                if statement.startswith("DELETE") and cursor.rowcount > 0:
+                    logger.warning("迁移删除了%s条重复记录", cursor.rowcount)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error("数据库迁移到版本%s失败: %s", target, str(e))
+            raise
+        logger.info("数据库已迁移到版本%s", target)
+        version = target
+    return version
+
+def configure_db(conn: sqlite3.Connection) -> None:
+    """设置 WAL 日志模式和同步级别，提升批量写入性能；加大页缓存并用内存映射读取"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+
+class Database:
+    """
+    数据库访问层：固定的数据库路径 + 连接池
+    连接用完归还，后续查询（包括其他后台任务线程）直接复用，不再重复建立连接；
+    每个连接创建时设置一次 PRAGMA，首个连接执行结构迁移。
+    长连接保留 sqlite3 的预编译语句缓存，相同 SQL 不再重复解析；
+    WAL 模式下读写互不阻塞，长按详情、检索可以与写库同时进行
+    """
+
+    def __init__(self, path: str = DB_PATH, pool_size: int = DB_POOL_SIZE):
+        self.path = os.path.abspath(path)
+        self.pool_size = pool_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._migrated = False
+
+    def set_path(self, path: str) -> None:
+        """切换数据库文件（启动时调用），关闭已有的空闲连接"""
+        self.close()
+        with self._lock:
+            self.path = os.path.abspath(path)
+            self._migrated = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+        try:
+            configure_db(conn)
+            with self._lock:
+                if not self._migrated:
+                    migrate_db(conn)
+                    self._migrated = True
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        从连接池取出一个连接，退出时归还
+        未提交的事务在归还时回滚，与关闭连接的效果相同
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                conn.close()
+            else:
+                with self._lock:
+                    if len(self._idle) < self.pool_size:
+                        self._idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    conn.close()
+
+    def close(self) -> None:
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+# 全局数据库访问对象（首次使用时才连接，导入模块时不打开数据库）
+database = Database()
+
+@timed('db.write')
+def upsert_videos(records: list, conn: sqlite3.Connection) -> list:
+    """
+    在单个事务中批量写入视频记录（INSERT ... ON CONFLICT(id) DO UPDATE）
+    records 为 build_record 生成的字典列表
+    返回：与 records 顺序一致的结果列表，取值为 'inserted' / 'updated' / 'failed'
+    """
+    sql = '''INSERT INTO videos (id, filename, size, width, height, duration, codec, bitrate, chs,
+                                 fingerprint, fp_head, path, volume)
+             VALUES (:id, :filename, :size, :width, :height, :duration, :codec, :bitrate, :chs,
+                     :fingerprint, :fp_head, :path, :volume)
+             ON CONFLICT(id) DO UPDATE SET
+                filename=excluded.filename, path=excluded.path, volume=excluded.volume,
+                size=excluded.size, width=excluded.width, height=excluded.height,
+                duration=excluded.duration, codec=excluded.codec, bitrate=excluded.bitrate,
+                chs=excluded.chs, fingerprint=COALESCE(excluded.fingerprint, fingerprint),
+                fp_head=COALESCE(excluded.fp_head, fp_head)'''
+    outcomes = ['failed'] * len(records)
+    valid = [i for i, record in enumerate(records) if record.get('id')]
+    params = {i: dict(records[i], **_path_columns(records[i]['path'])) for i in valid}
+    seen = set(query_ids([records[i]['id'] for i in valid], conn))
+    for i in valid:
+        outcomes[i] = 'updated' if records[i]['id'] in seen else 'inserted'
+        seen.add(records[i]['id'])
+    try:
+        with conn:
+            conn.executemany(sql, [params[i] for i in valid])
+    except sqlite3.Error as e:
+        # 整批失败时逐条重试，定位失败的记录
+        logger.error("批量写入失败，逐条重试: %s", str(e))
+        for i in valid:
+            try:
+                with conn:
+                    conn.execute(sql, params[i])
+            except sqlite3.Error as row_error:
+                logger.error("%s写入失败: %s", records[i]['id'], str(row_error))
+                outcomes[i] = 'failed'
+    return outcomes
+
+@functools.lru_cache(maxsize=1024)
+def volume_of(directory: str) -> str:
+    """目录所在的卷：Windows 为盘符或网络共享（\\\\服务器\\共享），其他系统为挂载点"""
+    drive = os.path.splitdrive(directory)[0]
+    if drive:
+        return drive
+    while not os.path.ismount(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory
+
+def _path_columns(file_path: str) -> dict:
+    """videos 表中 filename、path、volume 三列的值"""
+    path = os.path.abspath(file_path)
+    return {'filename': os.path.basename(path), 'path': path, 'volume': volume_of(os.path.dirname(path))}
+
+@timed('db.sync')
+def sync_moved_files(moves: Iterable[tuple], conn: sqlite3.Connection) -> int:
+    """
+    文件重命名/移动后同步 videos 表的 filename、path、volume 列，不提交事务
+    moves 为同时发生的 (原路径, 新路径)，先把匹配的记录标记为待定再写入新路径，因此链和环的顺序不影响结果
+    迁移到版本4之前写入的记录没有路径，按原文件名匹配
+    返回：更新的记录数
+    """
+    moves = list(moves)
+    conn.executemany(
+        "UPDATE videos SET path=? WHERE path=? OR (path IS NULL AND filename=?)",
+        [(f"<moving {n}>", os.path.abspath(old_path), os.path.basename(old_path))
+         for n, (old_path, _) in enumerate(moves)])
+    updated = 0
+    for n, (_, new_path) in enumerate(moves):
+        cursor = conn.execute(
+            "UPDATE videos SET filename=:filename, path=:path, volume=:volume WHERE path=:pending",
+            dict(_path_columns(new_path), pending=f"<moving {n}>"))
+        updated += cursor.rowcount
+    return updated
+
+class ProbeCache:
+    """
+    ffprobe 元数据的持久化缓存（保存在 avid.db 的 probe_cache 表中，表由数据库迁移创建）
+    以 绝对路径 + 文件大小 + 修改时间(ns) 作为键，文件未变化时直接返回缓存结果
+    """
+
+    def __init__(self, conn: sqlite3.Connection,
+                 max_entries: int = PROBE_CACHE_MAX_ENTRIES,
+                 max_age: float = PROBE_CACHE_MAX_AGE):
+        self.conn = conn
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @timed('db.cache')
+    def get(self, path: str, st: os.stat_result) -> Optional[dict]:
+        """按路径查询缓存，大小或修改时间不一致视为未命中"""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, info FROM probe_cache WHERE path=?",
+            (os.path.abspath(path),)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            self.hits += 1
+            return json.loads(row[2])
+        self.misses += 1
+        return None
+
+    @timed('db.cache')
+    def put(self, path: str, st: os.stat_result, info: dict) -> None:
+        """写入（或覆盖）一条缓存记录"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO probe_cache (path, size, mtime_ns, info, probed_at) VALUES (?,?,?,?,?)",
+            (os.path.abspath(path), st.st_size, st.st_mtime_ns, json.dumps(info), time.time()))
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """使单个文件的缓存失效；不传路径时清空全部缓存"""
+        if path is None:
+            self.conn.execute("DELETE FROM probe_cache")
+        else:
+            self.conn.execute("DELETE FROM probe_cache WHERE path=?", (os.path.abspath(path),))
+
+    def evict(self) -> int:
+        """按过期时间和最大条目数淘汰旧记录，返回删除的条数"""
+        cursor = self.conn.execute("DELETE FROM probe_cache WHERE probed_at < ?",
+                                   (time.time() - self.max_age,))
+        removed = cursor.rowcount
+        cursor = self.conn.execute('''DELETE FROM probe_cache WHERE path IN
+                                   (SELECT path FROM probe_cache ORDER BY probed_at DESC LIMIT -1 OFFSET ?)''',
+                                   (self.max_entries,))
+        return removed + cursor.rowcount
+
+    def move(self, old_path: str, new_path: str) -> None:
+        """文件被重命名/移动时迁移缓存记录，避免重新探测"""
+        self.conn.execute("UPDATE OR REPLACE probe_cache SET path=? WHERE path=?",
+                          (os.path.abspath(new_path), os.path.abspath(old_path)))
+
+    def stats(self) -> dict:
+        """返回命中/未命中计数"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        """淘汰过期记录并提交"""
+        self.evict()
+        self.conn.commit()
+        logger.info("探测缓存统计: %s", self.stats())
+
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS)
+
+@timed('fingerprint')
+def fingerprint_file(video_path: str, chunk_size: int = FINGERPRINT_CHUNK,
+                     deadline: Optional[float] = None) -> Optional[dict]:
+    """
+    计算文件的快速内容指纹：文件大小 + 头/中/尾各 chunk_size 字节的哈希，不读取整个文件
+    返回：{'fingerprint': 完整指纹, 'fp_head': 文件头取样哈希}；文件不可读时返回 None
+    整个进程同时计算指纹的线程数不超过 HASH_WORKERS
+    deadline 为 time.monotonic() 时刻，等待计算槽位或两次读取之间超过该时刻即放弃（返回 None）
+    """
+    def expired() -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+    wait_slot = None if deadline is None else max(0.0, deadline - time.monotonic())
+    if not _hash_slots.acquire(timeout=wait_slot):
+        logger.error("计算指纹超时: %s", video_path)
+        return None
+    try:
+        with open(video_path, 'rb', buffering=chunk_size) as f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(chunk_size)
+            digest = hashlib.blake2b(size.to_bytes(8, 'big'), digest_size=16)
+            digest.update(head)
+            if size > chunk_size:
+                for offset in (size // 2 - chunk_size // 2, size - chunk_size):
+                    if expired():
+                        logger.error("计算指纹超时: %s", video_path)
+                        return None
+                    f.seek(max(offset, chunk_size))
+                    digest.update(f.read(chunk_size))
+    except OSError as e:
+        logger.error("计算指纹失败: %s %s", video_path, str(e))
+        return None
+    finally:
+        _hash_slots.release()
+    return {
+        'fingerprint': digest.hexdigest(),
+        'fp_head': hashlib.blake2b(head, digest_size=16).hexdigest(),
+    }
+
+def probe_task(video_path: str, logger, timeout: Optional[float] = None,
+               info: Optional[dict] = None, fingerprint: bool = False) -> Optional[dict]:
+    """
+    工作线程中执行：必要时探测元数据，并按需补充内容指纹
+    timeout 是单个文件的总预算，元数据探测和指纹计算共用
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if info is None:
+        info = get_video_info(video_path, logger, timeout)
+    if info is not None and fingerprint and 'fingerprint' not in info:
+        info = {**info, **(fingerprint_file(video_path, deadline=deadline) or {})}
+    return info
+
+def probe_files(
+    video_files: Iterable[str],
+    logger,
+    cache: Optional[ProbeCache] = None,
+    max_workers: int = PROBE_WORKERS,
+    timeout: Optional[float] = PROBE_TIMEOUT,
+    progress: Optional[Callable[[int, int, str, Optional[dict]], None]] = None,
+    on_result: Optional[Callable[[str, Optional[dict]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    keep_results: bool = True,
+    fingerprint: bool = False
+) -> list:
+    """
+    使用有界线程池并行探测视频文件
+    video_files 可以是生成器（如 iter_video_files），遍历目录的同时即开始探测，
+    排队中的任务不超过 PROBE_MAX_PENDING 个，遍历速度不会超前太多
+    返回与 video_files 顺序一致的 [(文件路径, 元数据或None)] 列表；keep_results 为 False 时
+    不保留结果（返回空列表），只通过 on_result 输出，内存占用与目录大小无关
+    progress 回调参数为 (已完成数, 总数, 当前文件路径, 元数据或None)，在调用线程中执行；
+    video_files 为生成器时遍历结束前总数未知（为 None），受排队上限影响，已发现数只比已完成数多一点，不能当作总数
+    on_result 回调参数为 (文件路径, 元数据或None)，每个文件完成时（按完成顺序）在调用线程中执行
+    cancel 被设置后停止遍历和提交新任务，返回的列表只包含已发现的文件，未完成的元数据为 None
+    timeout 不为 None 时，任务开始执行后超过 timeout + PROBE_TIMEOUT_GRACE 秒仍未完成即记为失败，不再等待
+    （文件头读取、指纹计算等阻塞读取无法中断，卡住的工作线程留在后台，结束时不等待它们）；
+    所有工作线程都卡住、排队任务同样长时间无法开始时，排队任务也记为失败
+    fingerprint 为 True 时元数据中额外包含 fingerprint/fp_head 内容指纹（随探测结果一起缓存）
+    缓存的读写也只在调用线程中进行（sqlite 连接不能跨线程使用）；新结果先暂存，每 PARTIAL_BATCH 条在一个短事务中
+    写入并提交，不在探测期间占用数据库写锁（其他页面的写库、重命名可以同时进行）
+    """
+    files = []
+    results = []
+    in_flight = {}
+    started = {}
+    expired = 0
+    unsaved = []
+    last_activity = time.monotonic()
+    limit = timeout + PROBE_TIMEOUT_GRACE if timeout is not None else None
+    done = 0
+    discovered = 0
+    total = len(video_files) if isinstance(video_files, (list, tuple)) else None
+    walking = True
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    def finish(index: int, file_path: str, info: Optional[dict]) -> None:
+        nonlocal done
+        if keep_results:
+            results[index] = info
+        done += 1
+        profiler.count('files')
+        if info is None:
+            profiler.count('probe.failed')
+        else:
+            profiler.count('bytes', int(info.get('file_size', 0)))
+        if on_result:
+            on_result(file_path, info)
+        if progress:
+            progress(done, total if total is not None or walking else discovered, file_path, info)
+
+    def save_cache() -> None:
+        """把暂存的探测结果写入缓存并立即提交"""
+        for entry in unsaved:
+            cache.put(*entry)
+        cache.conn.commit()
+        unsaved.clear()
+
+    def run_task(index: int, *args) -> Optional[dict]:
+        started[index] = time.monotonic()
+        return probe_task(*args)
+
+    def deadline(index: int) -> float:
+        # 已开始的任务从开始时计时，排队中的任务从最近一次有任务开始或完成时计时
+        return started.get(index, max([last_activity, *list(started.values())])) + limit
+
+    def collect() -> None:
+        """等待至少一个探测任务完成（或超时）并处理结果"""
+        nonlocal expired, last_activity
+        wait_timeout = None
+        if limit is not None:
+            wait_timeout = max(0.0, min(deadline(entry[0]) for entry in in_flight.values()) - time.monotonic())
+        finished, _ = wait(in_flight, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+        if finished:
+            last_activity = time.monotonic()
+        for future in finished:
+            index, file_path, st, cached = in_flight.pop(future)
+            started.pop(index, None)
+            try:
+                info = future.result()
+            except Exception as e:
+                logger.error("探测失败: %s %s", file_path, str(e))
+                info = cached
+            if info is not None and cache is not None and info is not cached:
+                unsaved.append((file_path, st, info))
+                if len(unsaved) >= PARTIAL_BATCH:
+                    save_cache()
+            finish(index, file_path, info)
+        if limit is None:
+            return
+        now = time.monotonic()
+        for future, (index, file_path, st, cached) in list(in_flight.items()):
+            if now >= deadline(index) and not future.done():
+                future.cancel()
+                del in_flight[future]
+                started.pop(index, None)
+                expired += 1
+                profiler.count('probe.timeout')
+                logger.error("探测超时（%.0f 秒未完成），跳过: %s", limit, file_path)
+                finish(index, file_path, cached)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        for index, file_path in enumerate(video_files):
+            if cancelled():
+                break
+            discovered = index + 1
+            if keep_results:
+                files.append(file_path)
+                results.append(None)
+            st = None
+            if cache is not None:
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    logger.warning("文件不存在: %s", file_path)
+                    finish(index, file_path, None)
+                    continue
+                info = cache.get(file_path, st)
+                if info is not None and (not fingerprint or 'fingerprint' in info):
+                    profiler.count('probe.cache_hit')
+                    finish(index, file_path, info)
+                    continue
+            else:
+                info = None
+            # 缓存未命中，或命中但缺少指纹时提交到线程池
+            future = pool.submit(run_task, index, file_path, logger, timeout, info, fingerprint)
+            in_flight[future] = (index, file_path, st, info)
+            if len(in_flight) >= max(PROBE_MAX_PENDING, max_workers):
+                collect()
+        walking = False
+
+        while in_flight and not cancelled():
+            collect()
+    finally:
+        # 有超时任务时不等待卡住的工作线程
+        pool.shutdown(wait=not cancelled() and not expired, cancel_futures=cancelled())
+        if unsaved:
+            save_cache()
+    return list(zip(files, results))
+
+def take_snapshot(video_files: list) -> dict:
+    """
+    记录文件的 (inode, 大小, 修改时间ns)
+    返回：{文件路径: (inode, size, mtime_ns)}，无法访问的文件会被忽略
+    """
+    snapshot = {}
+    for file_path in video_files:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        snapshot[file_path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    return snapshot
+
+@timed('db.snapshot')
+def load_snapshot(scope: str, root: str, conn: sqlite3.Connection) -> dict:
+    """读取上次扫描保存的目录快照"""
+    rows = conn.execute("SELECT path, inode, size, mtime_ns FROM scan_snapshot WHERE scope=? AND root=?",
+                        (scope, os.path.abspath(root)))
+    return {path: (inode, size, mtime_ns) for path, inode, size, mtime_ns in rows}
+
+@timed('db.snapshot')
+def save_snapshot(scope: str, root: str, snapshot: dict, conn: sqlite3.Connection) -> None:
+    """用本次扫描结果覆盖保存目录快照"""
+    root = os.path.abspath(root)
+    with conn:
+        conn.execute("DELETE FROM scan_snapshot WHERE scope=? AND root=?", (scope, root))
+        conn.executemany("INSERT INTO scan_snapshot (scope, root, path, inode, size, mtime_ns) VALUES (?,?,?,?,?,?)",
+                         [(scope, root, path) + entry for path, entry in snapshot.items()])
+
+def diff_snapshot(old: dict, new: dict) -> dict:
+    """
+    比较两次快照
+    返回：{'added': [...], 'modified': [...], 'removed': [...],
+          'renamed': [(旧路径, 新路径)], 'unchanged': [...]}
+    重命名通过 inode + 文件大小 匹配已删除和新增的文件来识别
+    """
+    added = [path for path in new if path not in old]
+    removed = [path for path in old if path not in new]
+    modified = [path for path in new if path in old and new[path] != old[path]]
+    unchanged = [path for path in new if path in old and new[path] == old[path]]
+
+    removed_by_key = {old[path][:2]: path for path in removed}
+    renamed = []
+    for path in added:
+        old_path = removed_by_key.pop(new[path][:2], None)
+        if old_path is not None:
+            renamed.append((old_path, path))
+    if renamed:
+        renamed_old, renamed_new = map(set, zip(*renamed))
+        added = [path for path in added if path not in renamed_new]
+        removed = [path for path in removed if path not in renamed_old]
+    return {
+        'added': added,
+        'modified': modified,
+        'removed': removed,
+        'renamed': renamed,
+        'unchanged': unchanged,
+    }
+
 def sec_to_hms(seconds: float) -> tuple:
     """
     将秒数转换为时分秒格式
@@ -104,279 +1350,935 @@ def sec_to_hms(seconds: float) -> tuple:
         minutes += 1
         seconds = 0
 
-    return (hours, minutes, seconds)
-# 主逻辑函数 --------------------------------------------------
-def update_row(e, row, page):
-    """更新行数据"""
-    new_value = e.control.value
-    if e.control == row.cells[1].content:  # 电影ID列
-        row.cells[2].content.value = new_value + os.path.splitext(row.cells[0].content.value)[1]
-    page.update()
+    return (hours, minutes, seconds)
+
+def format_duration(seconds: Optional[float]) -> str:
+    """秒数格式化为 "时:分:秒"，仅用于显示"""
+    return "{:02d}:{:02d}:{:02d}".format(*sec_to_hms(seconds or 0.0))
+
+def format_size(size: Optional[int]) -> str:
+    """字节数格式化为 MB，仅用于显示"""
+    return f"{(size or 0) / 1024 / 1024:.2f} MB"
+
+def format_resolution(record: dict) -> str:
+    """宽、高格式化为 "宽x高"，仅用于显示"""
+    return f"{record['width']}x{record['height']}"
+
+def build_record(file_path: str, movie_id: str, info: dict) -> dict:
+    """根据探测结果生成写入数据库用的视频记录，数值均为原始单位（字节、像素、秒），显示时再格式化"""
+    return {
+        'id': movie_id,
+        'path': file_path,
+        'filename': os.path.basename(file_path),
+        'size': int(info['file_size']),
+        'width': int(info['video_width']),
+        'height': int(info['video_height']),
+        'duration': float(info['video_duration']),
+        'codec': info['video_codec_name'],
+        'bitrate': int(info['video_bitrate']),
+        'chs': os.path.splitext(os.path.basename(file_path))[0].endswith("-C"),
+        'fingerprint': info.get('fingerprint'),
+        'fp_head': info.get('fp_head'),
+    }
+
+def record_from_row(row: tuple) -> dict:
+    """把按 VIDEO_COLUMNS 顺序查询的 videos 表记录转换为与 build_record 相同键名的字典"""
+    record = dict(zip(VIDEO_COLUMNS, row))
+    record['chs'] = bool(record['chs'])
+    return record
+
+def quality_profile(record: dict) -> dict:
+    """
+    提取记录中用于画质对比的指标：
+    - pixels: 分辨率像素数
+    - bpp: 有效码率/像素，即码率乘以编码效率系数后除以像素数；码率未知时为 None
+      （MKV 等容器没有视频流码率，此时用 文件大小*8/时长 估算，时长也未知则无法估算）
+    - efficiency: 编码效率系数
+    - chs: 是否有中文字幕
+    - duration: 时长（秒）
+    """
+    pixels = (record['width'] or 0) * (record['height'] or 0)
+    efficiency = CODEC_EFFICIENCY.get(str(record['codec']).lower(), 1.0)
+    bitrate = int(record['bitrate'] or 0)
+    if not bitrate and record['size'] and record['duration']:
+        bitrate = int(record['size'] * 8 / record['duration'])
+    return {
+        'pixels': pixels,
+        'bpp': bitrate * efficiency / pixels if pixels and bitrate else None,
+        'efficiency': efficiency,
+        'chs': bool(record['chs']),
+        'duration': record['duration'] or 0.0,
+    }
+
+def _compare_metric(new: float, old: float) -> int:
+    """按 QUALITY_MARGIN 比较两个指标：1 更高，-1 更低，0 相当"""
+    if new > old * QUALITY_MARGIN:
+        return 1
+    if old > new * QUALITY_MARGIN:
+        return -1
+    return 0
+
+def compare_quality(new: dict, old: dict) -> tuple:
+    """
+    比较两条视频记录的画质，按 分辨率 > 有效码率/像素 > 中文字幕 的优先级逐项判断
+    返回:
+        (结论, 原因列表)，结论为 'upgrade' / 'downgrade' / 'same' / 'mismatch'（时长不符，可能是不同版本）
+    """
+    a, b = quality_profile(new), quality_profile(old)
+    if a['duration'] and b['duration']:
+        diff = abs(a['duration'] - b['duration'])
+        if diff > max(DURATION_MIN_DIFF, DURATION_TOLERANCE * max(a['duration'], b['duration'])):
+            return ('mismatch', [f"时长相差{diff:.0f}秒"])
+    checks = [
+        (_compare_metric(a['pixels'], b['pixels']), '分辨率更高', '分辨率更低'),
+        # 任一方码率未知时跳过码率比较，不当作码率为 0
+        (_compare_metric(a['bpp'], b['bpp']) if a['bpp'] and b['bpp'] else 0, '有效码率更高', '有效码率更低'),
+        (int(a['chs']) - int(b['chs']), '有中文字幕', '缺少中文字幕'),
+    ]
+    reasons = [better if result > 0 else worse for result, better, worse in checks if result]
+    if a['efficiency'] != b['efficiency']:
+        reasons.append('编码更高效' if a['efficiency'] > b['efficiency'] else '编码效率更低')
+    for result, _, _ in checks:
+        if result:
+            return ('upgrade' if result > 0 else 'downgrade', reasons)
+    return ('same', reasons)
+
+def rank_quality(items: list, existing: dict) -> None:
+    """
+    批量评估一次扫描结果的画质，结果写入 item['quality'] 和 item['quality_reasons']：
+    - 同一ID的多个文件中只保留画质最好的一个作为候选，其余标记为 'inferior'
+    - 候选与数据库中该ID的最新记录比较，结论见 compare_quality
+    - 数据库中没有的ID结论为 None
+    参数:
+    - existing: query_ids 的返回结果
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(item['id'], []).append(item)
+    for movie_id, group in groups.items():
+        best = group[0]
+        for item in group[1:]:
+            if compare_quality(item, best)[0] == 'upgrade':
+                best = item
+        for item in group:
+            if item is not best:
+                item['quality'] = 'inferior'
+                item['quality_reasons'] = [f"{best['filename']} 画质更好"]
+        if movie_id in existing:
+            best['quality'], best['quality_reasons'] = compare_quality(best, existing[movie_id][0])
+        else:
+            best['quality'], best['quality_reasons'] = None, []
+
+# 主逻辑函数 --------------------------------------------------
+class ProgressReporter:
+    """
+    合并进度更新，按固定频率（PROGRESS_INTERVAL）刷新显示，并给出吞吐量和预计剩余时间
+    作为 probe_files 的 progress 回调使用；回调本身只更新计数，
+    实际的界面刷新由后台线程完成，因此不会阻塞调用方（包括后台工作线程）
+    render(text) 负责把进度文本显示出来，例如写入 ft.Text 并 page.update()
+    总数为 None（边遍历目录边探测、总数未知）时只显示已完成数，不显示预计剩余时间
+    """
+
+    def __init__(self, render: Callable[[str], None], interval: float = PROGRESS_INTERVAL):
+        self.render = render
+        self.interval = interval
+        self.started = time.monotonic()
+        self.done = 0
+        self.total = 0
+        self.bytes = 0
+        self.current = ''
+        self.updates = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __call__(self, done: int, total: Optional[int], file_path: str, info: Optional[dict] = None) -> None:
+        with self._lock:
+            self.done = done
+            self.total = total
+            self.current = file_path
+            if info:
+                self.bytes += int(info.get('file_size', 0))
+            self._dirty = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def text(self) -> str:
+        """生成当前进度文本"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            rate = self.done / elapsed
+            speed = f"{rate:.1f} 个/秒 {self.bytes / 1024 / 1024 / elapsed:.1f} MB/秒"
+            if self.total is None:
+                return f"正在处理： {self.current} 处理进度 {self.done}/?（正在遍历目录） | {speed}"
+            eta = sec_to_hms((self.total - self.done) / rate) if rate else (0, 0, 0)
+            return (f"正在处理： {self.current} 处理进度 {self.done}/{self.total} | {speed} "
+                    f"预计剩余 {eta[0]:02d}:{eta[1]:02d}:{eta[2]:02d}")
+
+    def _push(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        self.updates += 1
+        self.render(self.text())
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._push()
+
+    def flush(self) -> None:
+        """停止后台刷新，并同步显示最后一次进度"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._push()
+
+def ui_progress(page: ft.Page, show_message: ft.Text) -> ProgressReporter:
+    """生成显示在界面状态栏的进度回调"""
+    def render(text: str) -> None:
+        show_message.value = text
+        page.update()
+    return ProgressReporter(render)
+
+class Job:
+    """后台任务：带编号，通过 cancel_event 实现协作式取消"""
+
+    def __init__(self, job_id: int, key: str, name: str):
+        self.id = job_id
+        self.key = key
+        self.name = name
+        self.status = 'running'
+        self.cancel_event = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+class JobRunner:
+    """
+    在后台线程中运行扫描、重命名、写库等任务，避免阻塞界面
+    key 表示任务作用的表格，同一个 key 同时只允许一个任务运行
+    notify(text) 用于向界面报告任务被拒绝、取消或失败
+    """
+
+    def __init__(self, notify: Optional[Callable[[str], None]] = None):
+        self.notify = notify or (lambda text: None)
+        self._ids = itertools.count(1)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, name: str, func: Callable[[Job], None]) -> Optional[Job]:
+        """提交任务，func 接收 Job 对象；同一表格已有任务运行时拒绝并返回 None"""
+        with self._lock:
+            running = self._active.get(key)
+            if running is not None:
+                self.notify(f"任务#{running.id}（{running.name}）正在运行，请等待完成或先停止")
+                return None
+            job = Job(next(self._ids), key, name)
+            self._active[key] = job
+        threading.Thread(target=self._run, args=(job, func), daemon=True).start()
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], None]) -> None:
+        logger.info("任务#%s（%s）开始", job.id, job.name)
+        try:
+            with profiler.run(job.name):
+                func(job)
+            job.status = 'cancelled' if job.cancelled else 'done'
+        except Exception as e:
+            job.status = 'failed'
+            logger.exception("任务#%s（%s）失败: %s", job.id, job.name, str(e))
+            self.notify(f"任务#{job.id}（{job.name}）失败: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(job.key, None)
+        logger.info("任务#%s（%s）结束: %s", job.id, job.name, job.status)
+
+    def cancel(self, key: str) -> bool:
+        """请求停止某个表格上正在运行的任务"""
+        with self._lock:
+            job = self._active.get(key)
+        if job is None:
+            return False
+        job.cancel()
+        self.notify(f"正在停止任务#{job.id}（{job.name}）...")
+        return True
+
+class ResultModel:
+    """
+    扫描结果的内存模型，每个元素是一个字典
+    排序和筛选只作用于模型，界面按页取数据，不需要重建全部控件
+    """
+
+    def __init__(self, page_size: int = PAGE_SIZE, filter_keys: tuple = ('filename', 'id')):
+        self.items = []
+        self.page_size = page_size
+        self.page_index = 0
+        self.filter_keys = filter_keys
+        self.filter_text = ''
+        self.sort_key = None
+        self.sort_ascending = True
+        self._view = None
+
+    def set_items(self, items: list, reset_page: bool = True) -> None:
+        """替换全部数据，reset_page 为 True 时回到第一页"""
+        self.items = items
+        self._view = None
+        if reset_page:
+            self.page_index = 0
+        else:
+            self.goto(self.page_index)
+
+    def view(self) -> list:
+        """返回筛选、排序后的数据（结果会缓存，直到排序/筛选/数据变化）"""
+        if self._view is None:
+            view = self.items
+            if self.filter_text:
+                text = self.filter_text.lower()
+                view = [item for item in view
+                        if any(text in str(item.get(key, '')).lower() for key in self.filter_keys)]
+            if self.sort_key is not None:
+                key = self.sort_key
+                # 空值（None）无论升降序都排在最后；数值排在字符串前面，编辑后的空字符串也不会与数值比较
+                present = [item for item in view if item.get(key) is not None]
+                missing = [item for item in view if item.get(key) is None]
+                view = sorted(present, key=lambda item: (isinstance(item[key], str), item[key]),
+                              reverse=not self.sort_ascending) + missing
+            self._view = view
+        return self._view
+
+    def sort(self, key: Optional[str], ascending: bool = True) -> None:
+        """按字段排序，key 为 None 时恢复扫描顺序"""
+        self.sort_key = key
+        self.sort_ascending = ascending
+        self._view = None
+
+    def filter(self, text: str) -> None:
+        """按文件名/ID 模糊筛选（不区分大小写）"""
+        self.filter_text = text.strip()
+        self.page_index = 0
+        self._view = None
+
+    @property
+    def total(self) -> int:
+        return len(self.view())
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.total / self.page_size))
+
+    def goto(self, page_index: int) -> None:
+        """跳转到指定页（自动限制在有效范围内）"""
+        self.page_index = min(max(0, page_index), self.page_count - 1)
+
+    def page_items(self) -> list:
+        """返回当前页的 (序号, 数据) 列表"""
+        start = self.page_index * self.page_size
+        return list(enumerate(self.view()[start:start + self.page_size], start=start + 1))
+
+class SearchModel:
+    """
+    数据库检索结果的分页模型，接口与 ResultModel 相同，供 PagedTable 使用
+    每次翻页、排序、筛选都重新查询数据库，只取当前页的数据；filter 的文本作为全文检索条件
+    """
+
+    def __init__(self, db: Optional[Database] = None, page_size: int = PAGE_SIZE,
+                 on_refresh: Optional[Callable[[dict], None]] = None):
+        self.db = db  # None 表示使用全局的 database
+        self.page_size = page_size
+        self.on_refresh = on_refresh
+        self.page_index = 0
+        self.text = ''
+        self.filters = {}
+        self.sort_key = None
+        self.sort_ascending = True
+        self.result = {'total': 0, 'items': [], 'facets': {}}
+
+    def refresh(self) -> None:
+        """按当前条件重新查询当前页"""
+        try:
+            with (self.db or database).connection() as conn:
+                self.result = search_videos(conn, self.text, self.filters, self.page_index, self.page_size,
+                                            self.sort_key, self.sort_ascending)
+        except sqlite3.Error as e:
+            logger.error("检索失败: %s", str(e))
+            self.result = {'total': 0, 'items': [], 'facets': {}}
+        if self.on_refresh is not None:
+            self.on_refresh(self.result)
+
+    def set_filters(self, filters: dict) -> None:
+        """设置分面及范围条件并回到第一页"""
+        self.filters = filters
+        self.page_index = 0
+        self.refresh()
+
+    def sort(self, key: Optional[str], ascending: bool = True) -> None:
+        self.sort_key = key
+        self.sort_ascending = ascending
+        self.refresh()
+
+    def filter(self, text: str) -> None:
+        self.text = text.strip()
+        self.page_index = 0
+        self.refresh()
+
+    @property
+    def total(self) -> int:
+        return self.result['total']
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.total / self.page_size))
+
+    def goto(self, page_index: int) -> None:
+        self.page_index = min(max(0, page_index), self.page_count - 1)
+        self.refresh()
+
+    def page_items(self) -> list:
+        start = self.page_index * self.page_size
+        return list(enumerate(self.result['items'], start=start + 1))
+
+class PagedTable:
+    """
+    分页表格：ft.DataTable 只渲染模型中当前页的数据行
+    row_builder(item, sn) 负责把一条数据生成 ft.DataRow
+    sort_keys 为每一列对应的排序字段，None 表示该列不可排序
+    """
+
+    def __init__(self, data_table: ft.DataTable, page: ft.Page, row_builder: Callable,
+                 sort_keys: list, model: Optional[ResultModel] = None):
+        self.data_table = data_table
+        self.page = page
+        self.row_builder = row_builder
+        self.sort_keys = sort_keys
+        self.model = model or ResultModel()
+        for index, column in enumerate(data_table.columns):
+            if index < len(sort_keys) and sort_keys[index]:
+                column.on_sort = self.on_sort
+        self.page_label = ft.Text()
+        self.filter_field = ft.TextField(label="筛选", width=200, on_submit=self.on_filter)
+        self.controls = ft.Row([
+            self.filter_field,
+            ft.IconButton(ft.Icons.CHEVRON_LEFT, on_click=lambda _: self.show_page(self.model.page_index - 1)),
+            self.page_label,
+            ft.IconButton(ft.Icons.CHEVRON_RIGHT, on_click=lambda _: self.show_page(self.model.page_index + 1)),
+        ], alignment=ft.MainAxisAlignment.CENTER)
+
+    def set_items(self, items: list, reset_page: bool = True) -> None:
+        self.model.set_items(items, reset_page)
+        self.render()
+
+    def render(self) -> None:
+        """只为当前页生成数据行"""
+        self.data_table.rows = [self.row_builder(item, sn) for sn, item in self.model.page_items()]
+        self.page_label.value = f"{self.model.page_index + 1}/{self.model.page_count} 页，共{self.model.total}条"
+        self.page.update()
+
+    def show_page(self, page_index: int) -> None:
+        self.model.goto(page_index)
+        self.render()
+
+    def on_sort(self, e) -> None:
+        self.model.sort(self.sort_keys[e.column_index], e.ascending)
+        self.data_table.sort_column_index = e.column_index
+        self.data_table.sort_ascending = e.ascending
+        self.render()
+
+    def on_filter(self, e) -> None:
+        self.model.filter(self.filter_field.value or '')
+        self.render()
+
+def update_row(e, item: dict, key: str, page: ft.Page, new_name_field: Optional[ft.TextField] = None) -> None:
+    """把表格中编辑的值写回数据模型"""
+    new_value = e.control.value
+    item[key] = new_value
+    if new_name_field is not None:  # 电影ID列
+        item['new_name'] = new_value + os.path.splitext(item['filename'])[1]
+        new_name_field.value = item['new_name']
+    page.update()
+
+def reusable_items(items: list, changes: dict, cache: ProbeCache) -> dict:
+    """
+    增量刷新时找出可以直接复用的数据
+    返回：{文件路径: 数据}，只包含未变化的文件；被重命名的文件迁移探测缓存后重新生成
+    """
+    for old_path, new_path in changes['renamed']:
+        cache.move(old_path, new_path)
+    unchanged = set(changes['unchanged'])
+    logger.info("增量扫描: 新增%s 修改%s 删除%s 重命名%s 未变化%s",
+                len(changes['added']), len(changes['modified']), len(changes['removed']),
+                len(changes['renamed']), len(unchanged))
+    return {item['path']: item for item in items if item['path'] in unchanged}
+
+def sync_scanned_moves(changes: dict, conn: sqlite3.Connection) -> None:
+    """把扫描发现的重命名/移动（按 inode 匹配）同步到数据库记录"""
+    if not changes['renamed']:
+        return
+    try:
+        with conn:
+            updated = sync_moved_files(changes['renamed'], conn)
+    except sqlite3.Error as e:
+        logger.error("同步重命名到数据库失败: %s", str(e))
+    else:
+        logger.info("扫描发现%s个文件被重命名，更新了%s条数据库记录", len(changes['renamed']), updated)
+
+def scan_directory(
+    scope: str,
+    directory: str,
+    items: list,
+    conn: sqlite3.Connection,
+    cache: ProbeCache,
+    progress: Callable[[int, int, str, Optional[dict]], None],
+    incremental: bool = False,
+    on_result: Optional[Callable[[str, Optional[dict]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    fingerprint: bool = False
+) -> tuple:
+    """
+    扫描目录并探测需要处理的文件，同时保存本次扫描的目录快照
+    全量扫描时边遍历边探测；增量扫描时只探测变化的文件
+    on_result、cancel 和 fingerprint 直接传给 probe_files
+    返回：(视频文件列表, {文件路径: 元数据}, {文件路径: 可复用的数据})
+    """
+    kept_items = {}
+    if incremental and items:
+        video_files = find_video_files(directory)
+        snapshot = take_snapshot(video_files)
+        changes = diff_snapshot(load_snapshot(scope, directory, conn), snapshot)
+        kept_items = reusable_items(items, changes, cache)
+        sync_scanned_moves(changes, conn)
+        conn.commit()  # 探测期间不保持写事务
+        to_probe = [file_path for file_path in video_files if file_path not in kept_items]
+        probed = probe_files(to_probe, logger, cache, progress=progress, on_result=on_result,
+                             cancel=cancel, fingerprint=fingerprint)
+    else:
+        probed = probe_files(profiler.iterate('walk', iter_video_files(directory)), logger, cache,
+                             progress=progress, on_result=on_result, cancel=cancel, fingerprint=fingerprint)
+        video_files = [file_path for file_path, _ in probed]
+        snapshot = take_snapshot(video_files)
+        old_snapshot = load_snapshot(scope, directory, conn)
+        if old_snapshot:
+            sync_scanned_moves(diff_snapshot(old_snapshot, snapshot), conn)
+    save_snapshot(scope, directory, snapshot, conn)
+    return video_files, dict(probed), kept_items
+
+def build_rename_row(item: dict, sn: int, page: ft.Page) -> ft.DataRow:
+    """生成重命名表格的一行"""
+    new_name_field = ft.TextField(value=item['new_name'], on_change=lambda e: update_row(e, item, 'new_name', page))
+    return ft.DataRow(
+        cells=[
+            ft.DataCell(ft.Text(sn)),
+            ft.DataCell(ft.Text(item['filename'])),
+            ft.DataCell(ft.TextField(value=item['id'], on_change=lambda e: update_row(e, item, 'id', page, new_name_field))),
+            ft.DataCell(new_name_field),
+            ft.DataCell(ft.Text(format_size(item['size']))),
+            ft.DataCell(ft.Text(item['format'])),
+        ]
+    )
+
+def plan_new_name(filename: str) -> tuple:
+    """
+    根据文件名生成规范化的新文件名
+    返回：(电影ID, 新文件名)；无法识别电影ID时返回 (None, None)，不应改名
+    """
+    main_name, filename_extension = os.path.splitext(filename)
+    movie_id = load_id_extractor().extract(filename)
+    if movie_id is None:
+        return None, None
+    # 添加-C后缀判断
+    suffix = find_suffix(main_name)
+    return movie_id, f"{movie_id}{suffix}{filename_extension}"
+
+def rename_item(file_path: str, info: dict) -> dict:
+    """根据探测结果生成重命名表格的一条数据"""
+    # 添加filename定义（从file_path提取文件名）
+    filename = os.path.basename(file_path)  # ← 新增此行
+    movie_id, new_name = plan_new_name(filename)
+    if movie_id is None:
+        # 无法识别的文件保持原名（重命名时跳过），可在表格中手动填写ID
+        movie_id, new_name = '', filename
+    return {
+        'path': file_path,
+        'filename': filename,
+        'id': movie_id,
+        'new_name': new_name,
+        'size': int(info['file_size']),
+        'format': info['file_format'],
+    }
+
+def rename_read(
+    directory: str,
+    table: PagedTable,
+    page: ft.Page,
+    show_message: ft.Text,
+    incremental: bool = False,
+    cancel: Optional[threading.Event] = None
+) -> None:
+    """读取目录视频文件并构建重命名表格，incremental 为 True 时只处理上次读取后变化的文件"""
+    show_message.value =f"正在读取目录{directory}下文件..."
+    logger.info(f"正在读取目录{directory}下文件...")
+    page.update()
+    progress = ui_progress(page, show_message)
+    new_items = {}
+
+    def on_result(file_path: str, info: Optional[dict]) -> None:
+        if info is None:
+            logger.warning(f"无法获取文件信息: {file_path}")
+            return
+        new_items[file_path] = rename_item(file_path, info)
+        # 分批显示已完成的部分结果
+        if len(new_items) % PARTIAL_BATCH == 0:
+            table.set_items(list(new_items.values()), reset_page=False)
+
+    with database.connection() as conn:
+        cache = ProbeCache(conn)
+        video_files, _, kept_items = scan_directory(
+            'rename', directory, table.model.items, conn, cache, progress, incremental, on_result, cancel)
+        progress.flush()
+        cache.close()
+    all_items = [
+        kept_items.get(file_path) or new_items[file_path]
+        for file_path in video_files
+        if file_path in kept_items or file_path in new_items
+    ]
+    table.set_items(all_items)
+    show_message.value = "读取已取消，仅显示部分结果" if cancel is not None and cancel.is_set() else "文件读取完成"
+    page.update()
+    logger.info(show_message.value)
+
+def toggle_selected(e, item: dict, page: ft.Page) -> None:
+    """切换行的选中状态，并同步到数据模型（手动选择后不再被自动勾选覆盖）"""
+    e.control.selected = not e.control.selected
+    item['selected'] = e.control.selected
+    item['manual'] = True
+    page.update()
+
+def open_videoinf(e, page: ft.Page, item: dict) -> None:
+    """长按行时弹窗对比当前视频与数据库中相同ID的记录，并列出画质对比结论及原因"""
+    with database.connection() as conn:
+        res=query_id(item['id'],conn)
+    all_rows=[]
+    all_rows.append(
+        ft.DataRow(cells=[           
+            ft.DataCell(ft.Text('当前视频')),
+            ft.DataCell(ft.Text(item['filename'])),
+            ft.DataCell(ft.Text(item['id'])),
+            ft.DataCell(ft.Text(format_size(item['size']))),
+            ft.DataCell(ft.Text(format_resolution(item))),
+            ft.DataCell(ft.Text(format_duration(item['duration']))),
+            ft.DataCell(ft.Text(item['codec'])),
+            ft.DataCell(ft.Text(str(item['bitrate']))),
+            ft.DataCell(ft.Text('是' if item['chs'] else '否')),
+            ft.DataCell(ft.Text(QUALITY_LABELS.get(item.get('quality'), '-'))),
+            ]  # ← 确保所有值都用ft.Text包装
+        ))
+    for sn, i in enumerate(res, start=1):
+        verdict, reasons = compare_quality(item, i)
+        row=ft.DataRow(cells=[           
+            ft.DataCell(ft.Text(str(sn))),  # 确保数值转换为字符串
+            ft.DataCell(ft.Text(str(i['filename']))),
+            ft.DataCell(ft.Text(str(i['id']))),
+            ft.DataCell(ft.Text(format_size(i['size']))),
+            ft.DataCell(ft.Text(format_resolution(i))),
+            ft.DataCell(ft.Text(format_duration(i['duration']))),
+            ft.DataCell(ft.Text(str(i['codec']))),
+            ft.DataCell(ft.Text(str(i['bitrate']))),
+            ft.DataCell(ft.Text('是' if i['chs'] else '否')),
+            ft.DataCell(ft.Text(f"当前视频{QUALITY_LABELS[verdict]}：{'、'.join(reasons)}" if reasons
+                                else f"当前视频{QUALITY_LABELS[verdict]}")),
+            ]  # ← 确保所有值都用ft.Text包装
+        )
+        all_rows.append(row)
+    
+    # 确保对话框内容使用Container控件包装
+    dlg = ft.AlertDialog(
+        title=ft.Text("视频文件详情"),
+        content=ft.Container(
+            content=ft.DataTable(
+                columns=[
+                    ft.DataColumn(ft.Text("序号")),  # 必须使用DataColumn实例
+                    ft.DataColumn(ft.Text("文件名")),
+                    ft.DataColumn(ft.Text("电影ID")),
+                    ft.DataColumn(ft.Text("文件大小")),
+                    ft.DataColumn(ft.Text("分辨率")),
+                    ft.DataColumn(ft.Text("时长")),
+                    ft.DataColumn(ft.Text("视频编码")),
+                    ft.DataColumn(ft.Text("视频码率(Kbps)")),
+                    ft.DataColumn(ft.Text("是否中文字幕")),
+                    ft.DataColumn(ft.Text("画质对比")),
+                ],
+                rows=all_rows
+            ),
+            padding=10
+        ),
+        modal=True,
+        actions=[
+            ft.TextButton("关闭", on_click=lambda e: page.close(dlg))
+        ],
+        actions_alignment=ft.MainAxisAlignment.CENTER,
+    )
+    page.open(dlg)
+
+def resolve_exists(items: list, conn: sqlite3.Connection) -> None:
+    """
+    批量查询数据是否已在数据库中、是否有内容重复及画质对比结论，
+    未手动选择的行自动勾选：不存在的记录和画质升级的记录（排除完全重复和同ID中较差的副本）
+    """
+    existing = query_ids([item['id'] for item in items], conn)
+    find_duplicates(items, conn)
+    rank_quality(items, existing)
+    for item in items:
+        item['exists'] = item['id'] in existing
+        if not item.get('manual'):
+            item['selected'] = (item['duplicate'] != 'exact' and item['quality'] != 'inferior'
+                                and (not item['exists'] or item['quality'] == 'upgrade'))
+
+def exists_label(item: dict) -> str:
+    """“存在”列的显示文本，附带画质对比结论"""
+    label = QUALITY_LABELS.get(item.get('quality'))
+    if item['exists']:
+        return f"有·{label}" if label else '有'
+    if item.get('duplicate') == 'exact':
+        return f"重复 {','.join(item['duplicate_of'])}"
+    if item.get('duplicate') == 'likely':
+        return f"疑似 {','.join(item['duplicate_of'])}"
+    return f"无·{label}" if label else '无'
+
+def build_query_row(item: dict, sn: int, page: ft.Page) -> ft.DataRow:
+    """生成数据查询表格的一行"""
+    return ft.DataRow(
+        cells=[
+                ft.DataCell(ft.Text(sn)),
+                ft.DataCell(ft.Text(item['filename'])),
+                ft.DataCell(ft.Text(item['id'])),
+                ft.DataCell(ft.Text(format_size(item['size']))),
+                ft.DataCell(ft.Text(format_resolution(item))),
+                ft.DataCell(ft.Text(format_duration(item['duration']))),
+                ft.DataCell(ft.Text(item['codec'])),
+                ft.DataCell(ft.Text(str(item['bitrate']))),
+                ft.DataCell(ft.Text("是" if item['chs'] else "否")),
+                ft.DataCell(ft.Text(exists_label(item)))
+        ],
+        on_select_changed=lambda e: toggle_selected(e, item, page),
+        on_long_press=lambda e: open_videoinf(e, page, item),
+        color=(ft.Colors.GREEN_50 if item.get('quality') == 'upgrade' else ft.Colors.YELLOW_50 if item['exists']
+               else ft.Colors.ORANGE_50 if item.get('duplicate') else ft.Colors.WHITE),
+        selected=item['selected']
+    )
+
+def build_search_row(item: dict, sn: int) -> ft.DataRow:
+    """生成检索结果表格的一行"""
+    return ft.DataRow(
+        cells=[
+                ft.DataCell(ft.Text(sn)),
+                ft.DataCell(ft.Text(item['id'])),
+                ft.DataCell(ft.Text(item['filename'])),
+                ft.DataCell(ft.Text(format_size(item['size']))),
+                ft.DataCell(ft.Text(format_resolution(item))),
+                ft.DataCell(ft.Text(format_duration(item['duration']))),
+                ft.DataCell(ft.Text(item['codec'])),
+                ft.DataCell(ft.Text(str(item['bitrate']))),
+                ft.DataCell(ft.Text("是" if item['chs'] else "否")),
+                ft.DataCell(ft.Text(item['path'] or '')),
+        ]
+    )
+
+def facet_options(facet: str, values: list) -> list:
+    """分面下拉框的选项：全部 + 各取值及命中数量（空值无法作为条件，不列出）"""
+    options = [ft.dropdown.Option(key='', text='全部')]
+    for value, count in values:
+        if value is None:
+            continue
+        if facet == 'chs':
+            options.append(ft.dropdown.Option(key='1' if value else '0', text=f"{'是' if value else '否'} ({count})"))
+        else:
+            options.append(ft.dropdown.Option(key=str(value), text=f"{value} ({count})"))
+    return options
+
+def read_search_filters(dropdowns: dict, ranges: dict) -> dict:
+    """
+    从检索面板读取条件
+    - dropdowns: {分面: ft.Dropdown}
+    - ranges: {'size_min'/'size_max'（MB）/'duration_min'/'duration_max'（分钟）: ft.TextField}
+    """
+    filters = {}
+    for facet, dropdown in dropdowns.items():
+        if dropdown.value:
+            filters[facet] = dropdown.value == '1' if facet == 'chs' else [dropdown.value]
+    for key, field in ranges.items():
+        try:
+            value = float(field.value)
+        except (TypeError, ValueError):
+            continue
+        filters[key] = value * 60 if key.startswith('duration') else value * 1024 * 1024
+    return filters
 
-def rename_read(
-    directory: str,
-    data_table: ft.DataTable,
-    page: ft.Page,
-    show_message: ft.Text
-) -> None:
-    """读取目录视频文件并构建重命名表格"""
-    show_message.value =f"正在读取目录{directory}下文件..."
-    logger.info(f"正在读取目录{directory}下文件...")
+def build_report_row(item: dict, sn: int) -> ft.DataRow:
+    """生成分组统计表格的一行"""
+    return ft.DataRow(
+        cells=[
+                ft.DataCell(ft.Text(sn)),
+                ft.DataCell(ft.Text(str(item['key']) if item['key'] is not None else '（无）')),
+                ft.DataCell(ft.Text(str(item['count']))),
+                ft.DataCell(ft.Text(f"{item['size'] / 1024 ** 3:.2f} GB")),
+                ft.DataCell(ft.Text(format_duration(item['duration']))),
+                ft.DataCell(ft.Text(str((item['bitrate'] or 0) // 1000))),
+                ft.DataCell(ft.Text(f"{item['share'] * 100:.2f}%")),
+        ]
+    )
+
+def build_reencode_row(item: dict, sn: int) -> ft.DataRow:
+    """生成转码候选表格的一行"""
+    return ft.DataRow(
+        cells=[
+                ft.DataCell(ft.Text(sn)),
+                ft.DataCell(ft.Text(item['id'])),
+                ft.DataCell(ft.Text(item['filename'])),
+                ft.DataCell(ft.Text(format_size(item['size']))),
+                ft.DataCell(ft.Text(format_resolution(item))),
+                ft.DataCell(ft.Text(item['codec'])),
+                ft.DataCell(ft.Text(str((item['bitrate'] or 0) // 1000))),
+                ft.DataCell(ft.Text(format_size(item['saving']))),
+                ft.DataCell(ft.Text(item['path'] or '')),
+        ]
+    )
+
+def report_read(report: str, table: PagedTable, page: ft.Page, msg: ft.Text,
+                min_bitrate: int = REENCODE_MIN_BITRATE) -> None:
+    """查询统计报表并显示在表格中，提示栏显示全库汇总"""
+    try:
+        with database.connection() as conn:
+            totals = library_totals(conn)
+            _, rows = report_rows(conn, report, REENCODE_CODECS, min_bitrate)
+            items = list(rows)
+        table.set_items(items)
+        msg.value = (f"全库共{totals['count']}个文件，{totals['size'] / 1024 ** 4:.2f} TB，"
+                     f"{totals['duration'] / 3600:.0f} 小时；{REPORT_TYPES[report]}共{len(items)}行")
+        if report == 'reencode':
+            msg.value += f"，转码为{REENCODE_TARGET}预计可节省{sum(item['saving'] for item in items) / 1024 ** 4:.2f} TB"
+    except sqlite3.Error as e:
+        logger.error(f"统计查询失败: {str(e)}")
+        msg.value = "统计查询失败"
     page.update()
-    video_files = find_video_files(directory)
-    sn = 1
-    all_rows = []
-    if data_table:
-        all_rows.clear()
-        for file_path in video_files:
-            show_message.value = f"正在处理： {file_path} 处理进度 {sn}/{len(video_files)}"
-            page.update()
-            info = get_video_info(file_path,logger)
-            if info is None:
-                logger.warning(f"无法获取文件信息: {file_path}")
-                continue
-                
-            # 添加filename定义（从file_path提取文件名）
-            filename = os.path.basename(file_path)  # ← 新增此行
-            main_name, filename_extension = os.path.splitext(filename)
-            movie_id = find_id(filename)
-            # 添加-C后缀判断
-            if main_name.endswith("-UC"):
-                suffix = "-C"
-            elif main_name.endswith("-C"):
-                suffix = "-C"
-            else:
-                suffix = ""
-
-            new_name = f"{movie_id}{suffix}{filename_extension}"
-            row = ft.DataRow(
-                cells=[
-                    ft.DataCell(ft.Text(sn)),
-                    ft.DataCell(ft.Text(filename)),
-                    ft.DataCell(ft.TextField(value=movie_id, on_change=lambda e: update_row(e, row, page))),
-                    ft.DataCell(ft.TextField(value=new_name, on_change=lambda e: update_row(e, row, page))),
-                    ft.DataCell(ft.Text(f"{int(info['file_size']) / 1024 / 1024:.2f} MB")),
-                    ft.DataCell(ft.Text(info['file_format'])),
-                ]
-            )
-            sn += 1
-            all_rows.append(row)
-    data_table.rows = all_rows
-    show_message.value = "文件读取完成"
+
+def report_export(report: str, file_path: str, page: ft.Page, msg: ft.Text,
+                  min_bitrate: int = REENCODE_MIN_BITRATE) -> None:
+    """直接从数据库逐行导出报表，格式按扩展名：.json、.jsonl，其余为 CSV"""
+    ext = os.path.splitext(file_path)[1].lower()
+    fmt = {'.json': 'json', '.jsonl': 'jsonl'}.get(ext, 'csv')
+    try:
+        with database.connection() as conn, open(file_path, 'w', encoding='utf-8', newline='') as out:
+            columns, rows = report_rows(conn, report, REENCODE_CODECS, min_bitrate)
+            count = export_report(rows, columns, out, fmt)
+        msg.value = f"已导出{count}行到 {file_path}"
+        logger.info(msg.value)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"报表导出失败: {str(e)}")
+        msg.value = "报表导出失败"
     page.update()
-    logger.info("文件读取完成")
 
 def query_read(
     directory: str,
-    data_table: ft.DataTable,
+    table: PagedTable,
     page: ft.Page,
-    show_message: ft.Text    
+    show_message: ft.Text,
+    incremental: bool = False,
+    cancel: Optional[threading.Event] = None
 ) -> None:
     """查询并显示目录中的视频文件信息。
     
     参数:
     - directory: 目录路径。
-    - data_table: 数据表对象。
+    - table: 分页表格对象。
     - page: 页面对象。
+    - incremental: 只处理上次读取后新增、修改或重命名的文件。
+    - cancel: 设置后尽快停止扫描，只显示已完成的部分结果。
     """
-    def select_changed(e,page):
-        if e.control.selected:
-            e.control.selected = False
-        else:
-            e.control.selected = True
+    try:
+        with database.connection() as conn:
+            _query_scan(directory, table, page, show_message, conn, incremental, cancel)
+    except sqlite3.Error as e:
+        logger.error(f"数据库查询错误: {e}")
+        show_message.value = "数据库查询失败"
         page.update()
 
-    def open_videoinf(e, page, file_path):
-
-        # 从事件对象获取行数据
-        row = e.control
-        # 提取并保存视频的片名
-        video_name = row.cells[1].content.value
-        # 提取并保存视频的唯一标识符
-        id = row.cells[2].content.value
-        # 提取并保存视频的尺寸信息
-        size = row.cells[3].content.value
-        # 提取并保存视频的分辨率信息
-        video_resolution = row.cells[4].content.value
-        # 提取并保存视频的时长信息
-        duration = row.cells[5].content.value
-        # 提取并保存视频的编解码器信息
-        video_codec = row.cells[6].content.value
-        # 提取并保存视频的比特率信息
-        video_bitrate = row.cells[7].content.value
-        #提取是否有中文字幕
-        chs = row.cells[8].content.value
-        conn = sqlite3.connect('avid.db')
-        res=query_id(id,conn)
-        conn.close()
-        all_rows=[]
-        all_rows.append(
-            ft.DataRow(cells=[           
-                ft.DataCell(ft.Text('当前视频')),
-                ft.DataCell(ft.Text(video_name)),
-                ft.DataCell(ft.Text(id)),
-                ft.DataCell(ft.Text(size)),
-                ft.DataCell(ft.Text(video_resolution)),
-                ft.DataCell(ft.Text(duration)),
-                ft.DataCell(ft.Text(video_codec)),
-                ft.DataCell(ft.Text(video_bitrate)),
-                ft.DataCell(ft.Text(chs)),
-                ]  # ← 确保所有值都用ft.Text包装
-            ))
-        for i in res:
-            row=ft.DataRow(cells=[           
-                ft.DataCell(ft.Text(str(sn))),  # 确保数值转换为字符串
-                ft.DataCell(ft.Text(str(i[2]))),
-                ft.DataCell(ft.Text(str(i[1]))),
-                ft.DataCell(ft.Text(f"{float(i[3]):.2f} MB")),
-                ft.DataCell(ft.Text(str(i[4]))),
-                ft.DataCell(ft.Text(str(i[5]))),
-                ft.DataCell(ft.Text(str(i[6]))),
-                ft.DataCell(ft.Text(str(i[7]))),
-                ft.DataCell(ft.Text('是' if i[8]==True else '否')),
-                ]  # ← 确保所有值都用ft.Text包装
-            )
-            all_rows.append(row)
-        
-        # 确保对话框内容使用Container控件包装
-        dlg = ft.AlertDialog(
-            title=ft.Text("视频文件详情"),
-            content=ft.Container(
-                content=ft.DataTable(
-                    columns=[
-                        ft.DataColumn(ft.Text("序号")),  # 必须使用DataColumn实例
-                        ft.DataColumn(ft.Text("文件名")),
-                        ft.DataColumn(ft.Text("电影ID")),
-                        ft.DataColumn(ft.Text("文件大小")),
-                        ft.DataColumn(ft.Text("分辨率")),
-                        ft.DataColumn(ft.Text("时长")),
-                        ft.DataColumn(ft.Text("视频编码")),
-                        ft.DataColumn(ft.Text("视频码率(Kbps)")),
-                        ft.DataColumn(ft.Text("是否中文字幕")),
-                    ],
-                    rows=all_rows
-                ),
-                padding=10
-            ),
-            modal=True,
-            actions=[
-                ft.TextButton("关闭", on_click=lambda e: page.close(dlg))
-            ],
-            actions_alignment=ft.MainAxisAlignment.CENTER,
-        )
-        page.open(dlg)
+def _query_scan(
+    directory: str,
+    table: PagedTable,
+    page: ft.Page,
+    show_message: ft.Text,
+    conn: sqlite3.Connection,
+    incremental: bool,
+    cancel: Optional[threading.Event]
+) -> None:
+    """query_read 的扫描过程，使用调用方从连接池取出的连接"""
+    cache = ProbeCache(conn)
+    progress = ui_progress(page, show_message)
+    new_items = {}
+    pending = []
 
-    try:
-        conn = sqlite3.connect('avid.db')
-    except Exception as e:
-        logger.error(f"数据库查询错误: {e}")
-    else:
-        logger.info("数据库连接成功")
-
-    video_files = find_video_files(directory)
-    sn = 1
-    all_rows = []
-    if data_table:
-        all_rows.clear()
-        # 在query_read函数中修改数据行创建部分
-        for file_path in video_files:
-            show_message.value = f"正在处理： {file_path} 处理进度 {sn}/{len(video_files)}"
-            page.update()
-            info = get_video_info(file_path,logger)
-            if info is None:
-                logger.warning(f"无法获取文件信息: {file_path}")
-                continue
-                
-            filename = os.path.basename(file_path)
-            main_name=os.path.splitext(filename)[0]
-            movie_id = find_id(filename)
-            id_exist = query_id(movie_id,conn)
-            if id_exist:
-                display_alert = ft.Text('有')
-                row_selected = False
-            else:
-                display_alert = ft.Text('无')
-                row_selected = True
-            hms = sec_to_hms(info['video_duration'])
-            row = ft.DataRow(
-                cells=[
-                        ft.DataCell(ft.Text(sn)),
-                        ft.DataCell(ft.Text(filename)),  # ← 使用已定义的filename变量
-                        ft.DataCell(ft.Text(movie_id)),
-                        ft.DataCell(ft.Text(f"{int(info['file_size']) / 1024 / 1024:.2f} MB")),
-                        ft.DataCell(ft.Text(str(info['video_width']) + "x" + str(info['video_height']))),
-                        ft.DataCell(ft.Text(f"{hms[0]:02d}:{hms[1]:02d}:{hms[2]:02d}")),  # 修改为格式化字符串
-                        ft.DataCell(ft.Text(info['video_codec_name'])),
-                        ft.DataCell(ft.Text(str(info['video_bitrate']))),
-                        ft.DataCell(ft.Text("是" if main_name.endswith("-C") else "否")),
-                        ft.DataCell(display_alert)
-                ],
-                on_select_changed=lambda e: select_changed(e,page),
-                on_long_press=lambda e, path=file_path: open_videoinf(e, page, path),  # 添加路径参数
-                color=ft.Colors.YELLOW_50 if id_exist else ft.Colors.WHITE,
-                selected=row_selected
-            )  # 确保闭合括号正确对齐
-            sn += 1  # ← 修正缩进层级（4个空格）
-            all_rows.append(row)  # ← 修正缩进层级（4个空格）
-            
-    data_table.rows = all_rows
-    conn.close()
-    show_message.value = "数据更新完成"
+    def on_result(file_path: str, info: Optional[dict]) -> None:
+        if info is None:
+            logger.warning(f"无法获取文件信息: {file_path}")
+            return
+        item = build_record(file_path, find_id(os.path.basename(file_path)), info)
+        new_items[file_path] = item
+        pending.append(item)
+        # 分批查询是否存在并显示已完成的部分结果
+        if len(pending) >= PARTIAL_BATCH:
+            resolve_exists(pending, conn)
+            pending.clear()
+            table.set_items(list(new_items.values()), reset_page=False)
+
+    video_files, _, kept_items = scan_directory(
+        'query', directory, table.model.items, conn, cache, progress, incremental, on_result, cancel,
+        fingerprint=True)
+    progress.flush()
+    all_items = [
+        kept_items.get(file_path) or new_items[file_path]
+        for file_path in video_files
+        if file_path in kept_items or file_path in new_items
+    ]
+    # 一次性批量刷新所有ID是否已存在（复用的数据也需要刷新）
+    resolve_exists(all_items, conn)
+
+    cache.close()
+    table.set_items(all_items)
+    show_message.value = "查询已取消，仅显示部分结果" if cancel is not None and cancel.is_set() else "数据更新完成"
     page.update()
-    logger.info("数据更新完成")
+    logger.info(show_message.value)
 
 
-def write_db(data_table: ft.DataTable, page: ft.Page, msg: ft.Text, logger) -> None:
+def write_db(table: PagedTable, page: ft.Page, msg: ft.Text, logger) -> None:
     """将数据写入数据库"""
     try:
-        conn = sqlite3.connect('avid.db')
-        cursor = conn.cursor()
-        # 同步更新表结构
-        cursor.execute('''CREATE TABLE IF NOT EXISTS videos
-                        (sn INTEGER PRIMARY KEY AUTOINCREMENT,
-                        id TEXT, filename TEXT, size REAL, 
-                        resolution TEXT, duration REAL, 
-                        codec TEXT, bitrate INTEGER,
-                        chs BOOLEAN)''')  # 同步表结构
-        success = 0
-        failure = 0
-        # 遍历数据行插入记录
-        for row in data_table.rows:
-            if not row.selected:
-                continue
-            # 从数据行提取信息
-            movie_id = row.cells[2].content.value  # 电影ID列
-            filename = row.cells[1].content.value  # 文件名列
-            size_mb = float(row.cells[3].content.value.split()[0])  # 文件大小(MB)
-            resolution = row.cells[4].content.value  # 分辨率
-            duration_str = row.cells[5].content.value  # 时长(H:M:S)
-            codec = row.cells[6].content.value  # 视频编码
-            bitrate = int(row.cells[7].content.value)  # 视频码率
-            chs = True if row.cells[8].content.value == '是' else False  # 是否中文字幕
-            
-            cursor.execute('''SELECT * FROM videos WHERE id = ?''', (movie_id,))
-            select_res =  cursor.fetchall()
-            if select_res:
-                logger.info(f"{movie_id}数据已存在，更新")
-                cursor.execute('''UPDATE videos SET filename =?, size =?, resolution =?, duration =?, codec =?, bitrate =?, chs =? WHERE id =?''',
-                            (filename, size_mb, resolution, duration_str, codec, bitrate, chs, movie_id))
-            else:
-                logger.info(f"{movie_id}数据不存在，新增")            
-                # 执行INSERT操作
-                cursor.execute('''INSERT INTO videos 
-                                (id, filename, size, resolution, duration, codec, bitrate, chs)
-                                VALUES (?,?,?,?,?,?,?,?)''',
-                            (movie_id, filename, size_mb, resolution, 
-                            duration_str, codec, bitrate, chs))  
-            success += 1
-        conn.commit()
-        msg.value = f"共{len(data_table.rows)}记录，成功写入{success}条记录"
-        logger.info(f"共{len(data_table.rows)}记录，成功写入{success}条记录")
+        # 直接使用模型中的类型化记录，不再从界面文本反向解析
+        records = [item for item in table.model.items if item['selected']]
+        with database.connection() as conn:
+            outcomes = upsert_videos(records, conn)
+        for record, outcome in zip(records, outcomes):
+            logger.info(f"{record['id']}写入结果: {outcome}")
+            if outcome == 'updated':
+                # 替换已有记录时记录画质对比结论，手动勾选的非升级记录单独警告
+                verdict = QUALITY_LABELS.get(record.get('quality'), '未知')
+                reasons = '、'.join(record.get('quality_reasons') or [])
+                if record.get('quality') == 'upgrade':
+                    logger.info(f"{record['id']}替换已有记录（{verdict}）: {reasons}")
+                else:
+                    logger.warning(f"{record['id']}替换已有记录，但画质并非升级（{verdict}）: {reasons}")
+        success = len(outcomes) - outcomes.count('failed')
+        msg.value = (f"共{len(table.model.items)}记录，成功写入{success}条记录"
+                     f"（新增{outcomes.count('inserted')}条，替换{outcomes.count('updated')}条）")
+        logger.info(msg.value)
     except Exception as e:
         logger.error(f"数据库写入失败: {str(e)}")
         msg.value = "数据库写入失败"
-    finally:
-        conn.close()
     page.update()
 
 def query_id(movie_id: str, conn: sqlite3.Connection) -> list:
@@ -385,44 +2287,905 @@ def query_id(movie_id: str, conn: sqlite3.Connection) -> list:
     返回:
         包含匹配记录的列表（按时间倒序排列）
     """
+    return query_ids([movie_id], conn).get(movie_id, [])
+
+@timed('db.query')
+def query_ids(movie_ids, conn: sqlite3.Connection) -> dict:
+    """
+    批量查询数据库中的电影记录，按 SQL_IN_CHUNK 分批使用 IN (...) 查询
+    返回:
+        {电影ID: 记录列表}，只包含数据库中存在的ID，记录为 record_from_row 生成的字典，按时间倒序排列
+    """
+    unique_ids = list(dict.fromkeys(movie_ids))
+    found = {}
     try:
         cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS videos
-                        (sn INTEGER PRIMARY KEY AUTOINCREMENT,
-                        id TEXT, filename TEXT, size REAL, 
-                        resolution TEXT, duration REAL, 
-                        codec TEXT, bitrate INTEGER,
-                        chs BOOLEAN)''')  # 新增布尔字段
-        cursor.execute("SELECT * FROM videos WHERE id=?", (movie_id,))
-        return cursor.fetchall()
+        for start in range(0, len(unique_ids), SQL_IN_CHUNK):
+            chunk = unique_ids[start:start + SQL_IN_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT {', '.join(VIDEO_COLUMNS)} FROM videos WHERE id IN ({placeholders}) ORDER BY sn DESC",
+                           chunk)
+            for row in cursor.fetchall():
+                record = record_from_row(row)
+                found.setdefault(record['id'], []).append(record)
     except sqlite3.Error as e:
         logger.error("数据库查询错误: %s", str(e))
-        return []
+    return found
 
-def rename(data_table: ft.DataTable, path_field: ft.TextField, page: ft.Page, msg: ft.Text, logger) -> None:
-    """执行批量重命名操作"""
-    success = 0
-    failure = 0
-    base_dir = path_field.value
-    
-    for row in data_table.rows:
-        old_name = os.path.join(base_dir, row.cells[1].content.value)
-        new_name = os.path.join(base_dir, row.cells[3].content.value)
-        if new_name == old_name:
+@timed('db.duplicates')
+def find_duplicates(items: list, conn: sqlite3.Connection) -> None:
+    """
+    按内容指纹查找重复文件（不依赖电影ID），结果写入 item['duplicate'] 和 item['duplicate_of']：
+    - 'exact': 完整指纹相同，即字节级相同的文件
+    - 'likely': 仅文件头取样相同，例如未下载完整或尾部被修改的副本
+    同时检查数据库中的记录和本次扫描中先出现的文件，ID 相同的记录不算重复（已由“存在”体现）
+    """
+    with_fp = [item for item in items if item.get('fingerprint')]
+    matches = {}
+    try:
+        for column in ('fingerprint', 'fp_head'):
+            values = list(dict.fromkeys(item[column] for item in with_fp))
+            for start in range(0, len(values), SQL_IN_CHUNK):
+                chunk = values[start:start + SQL_IN_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(f"SELECT {column}, id FROM videos WHERE {column} IN ({placeholders})", chunk)
+                for value, movie_id in rows:
+                    matches.setdefault((column, value), set()).add(movie_id)
+    except sqlite3.Error as e:
+        logger.error("数据库查询错误: %s", str(e))
+    # 本次扫描内先出现的文件视为原件，只把后出现的标为重复
+    seen = {}
+    for item in items:
+        item['duplicate'] = None
+        item['duplicate_of'] = []
+        if not item.get('fingerprint'):
             continue
-        try:            
-            os.rename(old_name, new_name)
+        for column, kind in (('fingerprint', 'exact'), ('fp_head', 'likely')):
+            key = (column, item[column])
+            others = sorted((matches.get(key, set()) | seen.get(key, set())) - {item['id']})
+            if others:
+                item['duplicate'] = kind
+                item['duplicate_of'] = others
+                break
+        for column in ('fingerprint', 'fp_head'):
+            seen.setdefault((column, item[column]), set()).add(item['id'])
 
-        except Exception as e:
-            logger.error(f"重命名失败: {str(e)}")
-            failure += 1
+SEARCH_ORDERS = {'id': 'id', 'size': 'size', 'width': 'width', 'duration': 'duration',
+                 'codec': 'codec', 'bitrate': 'bitrate', 'chs': 'chs'}  # 可排序字段，均有对应索引
+
+def fts_query(text: str) -> str:
+    """
+    把用户输入转换为 FTS5 查询：按非字母数字拆分，每个词做前缀匹配，词之间为 AND
+    单个字符的词几乎匹配全部记录且没有前缀索引，直接忽略
+    """
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text) if len(term) > 1)
+
+def _search_where(text: str, filters: dict) -> tuple:
+    """
+    生成检索条件，返回 (WHERE 子句, 参数列表)
+    除 studio 外的列名前加 +，不使用这些列的单列索引，让查询按 idx_videos_facets 覆盖索引
+    或排序列的索引顺序扫描，避免对大量命中结果建临时 B 树
+    """
+    clauses = []
+    params = []
+    query = fts_query(text or '')
+    if query:
+        clauses.append("sn IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)")
+        params.append(query)
+    for facet in ('studio', 'codec', 'res_class'):
+        values = filters.get(facet)
+        if values:
+            column = facet if facet == 'studio' else f"+{facet}"
+            clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    if filters.get('chs') is not None:
+        clauses.append("+chs = ?")
+        params.append(int(bool(filters['chs'])))
+    for key, column, operator in (('size_min', 'size', '>='), ('size_max', 'size', '<='),
+                                  ('duration_min', 'duration', '>='), ('duration_max', 'duration', '<=')):
+        value = filters.get(key)
+        if value is None:
+            continue
+        clauses.append(f"+{column} {operator} ?")
+        params.append(value)
+    return ' AND '.join(clauses) or '1', params
+
+@timed('db.search')
+def search_videos(
+    conn: sqlite3.Connection,
+    text: str = '',
+    filters: Optional[dict] = None,
+    page_index: int = 0,
+    page_size: int = PAGE_SIZE,
+    order_by: Optional[str] = None,
+    ascending: bool = True,
+    facet_limit: int = SEARCH_FACET_LIMIT
+) -> dict:
+    """
+    检索数据库中的视频记录
+    参数:
+    - text: 对 id/文件名做全文前缀匹配，多个词之间为 AND
+    - filters: 分面及范围条件，studio/codec/res_class 为取值列表，chs 为布尔值，
+      size_min/size_max 以字节计，duration_min/duration_max 以秒计
+    - order_by: SEARCH_ORDERS 中的字段，默认按 id 排序
+    返回:
+        {'total': 命中总数, 'items': 当前页记录, 'facets': {分面: [(取值, 数量), ...]}}
+        分面数量基于全部筛选条件后的命中结果，按分面组合一次查询统计；没有任何条件时直接读取 video_facets 中的全库计数
+    """
+    where, params = _search_where(text, filters or {})
+    # 有全文条件时按全文索引的命中行号取行，否则按覆盖索引扫描
+    index_hint = '' if fts_query(text or '') else 'INDEXED BY idx_videos_facets'
+    total = 0
+    counts = {facet: {} for facet in SEARCH_FACETS}
+    if params:  # 每个检索条件都带参数，没有参数即没有条件
+        rows = conn.execute(
+            f"SELECT {', '.join(SEARCH_FACETS)}, COUNT(*) FROM videos {index_hint} "
+            f"WHERE {where} GROUP BY {', '.join(SEARCH_FACETS)}", params)
+        for *values, count in rows:
+            total += count
+            for facet, value in zip(SEARCH_FACETS, values):
+                counts[facet][value] = counts[facet].get(value, 0) + count
+    else:
+        for facet, value, count in conn.execute("SELECT facet, value, count FROM video_facets WHERE count > 0"):
+            counts[facet][value] = count
+        total = sum(counts['chs'].values())  # 每条记录恰好计入一个 chs 取值
+    facets = {
+        facet: sorted(((bool(value) if facet == 'chs' else value, count) for value, count in values.items()),
+                      key=lambda pair: (-pair[1], str(pair[0])))[:facet_limit]
+        for facet, values in counts.items()
+    }
+
+    # 命中少时先在覆盖索引中筛出命中行再排序；命中多时沿排序列的索引扫描，凑满一页即可停止
+    column = SEARCH_ORDERS.get(order_by, 'id')
+    if total <= SEARCH_SORT_LIMIT:
+        if index_hint:
+            where = f"sn IN (SELECT sn FROM videos {index_hint} WHERE {where})"
+        column = f"+{column}"
+    direction = 'ASC' if ascending else 'DESC'
+    cursor = conn.execute(
+        f"SELECT {', '.join(VIDEO_COLUMNS)} FROM videos WHERE {where} "
+        f"ORDER BY {column} {direction}, sn {direction} LIMIT ? OFFSET ?",
+        params + [page_size, page_index * page_size])
+    return {
+        'total': total,
+        'items': [record_from_row(row) for row in cursor],
+        'facets': facets,
+    }
+
+REPORT_TYPES = {'studio': "片商", 'codec': "视频编码", 'res_class': "分辨率", 'reencode': "转码候选"}
+REPORT_GROUP_INDEXES = {'studio': 'idx_videos_facets', 'codec': 'idx_videos_codec_stats',
+                        'res_class': 'idx_videos_res_stats'}  # 分组统计使用的索引，按分组列顺序扫描
+REPORT_COLUMNS = ('key', 'count', 'size', 'duration', 'bitrate', 'share')
+REENCODE_COLUMNS = VIDEO_COLUMNS + ('saving',)
+
+def library_totals(conn: sqlite3.Connection) -> dict:
+    """全库汇总：文件数、总大小（字节）、总时长（秒）"""
+    count, size, duration = conn.execute(
+        "SELECT COUNT(*), TOTAL(size), TOTAL(duration) FROM videos INDEXED BY idx_videos_facets").fetchone()
+    return {'count': count, 'size': int(size), 'duration': duration}
+
+def group_report(conn: sqlite3.Connection, group: str, total_size: Optional[int] = None) -> Iterator[dict]:
+    """
+    按片商/编码/分辨率等级分组统计，按总大小降序逐行返回
+    每行：key 分组值、count 文件数、size 总字节数、duration 总秒数、
+          bitrate 平均码率（总大小/总时长，bps）、share 占全库大小的比例
+    按分组列开头的索引顺序扫描汇总
+    """
+    index = REPORT_GROUP_INDEXES[group]
+    if total_size is None:
+        total_size = library_totals(conn)['size']
+    cursor = conn.execute(
+        f"SELECT {group}, COUNT(*), TOTAL(size), TOTAL(duration) FROM videos INDEXED BY {index} "
+        f"GROUP BY {group} ORDER BY 3 DESC")
+    for key, count, size, duration in cursor:
+        yield {'key': key, 'count': count, 'size': int(size), 'duration': duration,
+               'bitrate': int(size * 8 / duration) if duration else None,
+               'share': round(size / total_size, 4) if total_size else 0.0}
+
+def reencode_candidates(conn: sqlite3.Connection, codecs: Iterable[str] = REENCODE_CODECS,
+                        min_bitrate: int = REENCODE_MIN_BITRATE) -> Iterator[dict]:
+    """
+    转码候选：指定编码且码率不低于 min_bitrate 的记录，按码率降序逐条返回
+    saving 为按编码效率估算的转码为 REENCODE_TARGET 后可节省的字节数
+    """
+    codecs = list(codecs)
+    target = CODEC_EFFICIENCY[REENCODE_TARGET]
+    cursor = conn.execute(
+        f"SELECT {', '.join(VIDEO_COLUMNS)} FROM videos INDEXED BY idx_videos_codec_stats "
+        f"WHERE codec IN ({','.join('?' * len(codecs))}) AND bitrate >= ? ORDER BY bitrate DESC",
+        codecs + [min_bitrate])
+    for row in cursor:
+        record = record_from_row(row)
+        efficiency = CODEC_EFFICIENCY.get(str(record['codec']).lower(), 1.0)
+        record['saving'] = max(0, int((record['size'] or 0) * (1 - efficiency / target)))
+        yield record
+
+def export_report(rows: Iterable[dict], columns: Iterable[str], out, fmt: str = 'csv') -> int:
+    """
+    把报表逐行写入文件对象，不在内存中保留全部结果
+    fmt: csv（首行为列名）、json（一个数组）、jsonl（每行一条）
+    返回：写入的行数
+    """
+    columns = list(columns)
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for count, row in enumerate(rows, start=1):
+            writer.writerow([row.get(column) for column in columns])
+    elif fmt == 'json':
+        out.write('[')
+        for count, row in enumerate(rows, start=1):
+            out.write(',\n' if count > 1 else '\n')
+            out.write(json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False))
+        out.write('\n]\n')
+    elif fmt == 'jsonl':
+        for count, row in enumerate(rows, start=1):
+            write_jsonl({column: row.get(column) for column in columns}, out)
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    return count
+
+def report_rows(conn: sqlite3.Connection, report: str, codecs: Iterable[str] = REENCODE_CODECS,
+                min_bitrate: int = REENCODE_MIN_BITRATE) -> tuple:
+    """
+    按报表类型返回 (列名, 逐行生成器)，供界面显示和导出共用
+    """
+    if report == 'reencode':
+        return REENCODE_COLUMNS, reencode_candidates(conn, codecs, min_bitrate)
+    return REPORT_COLUMNS, group_report(conn, report)
+
+def _temp_rename_path(file_path: str) -> str:
+    """生成同目录下未被占用的临时文件名，用于打破重命名环"""
+    directory, name = os.path.split(file_path)
+    for n in itertools.count():
+        temp_path = os.path.join(directory, f".{name}.renaming{n or ''}")
+        if not os.path.lexists(temp_path):
+            return temp_path
+
+def plan_renames(renames: Iterable[tuple]) -> dict:
+    """
+    生成完整的重命名计划（不修改文件），参数为 (原路径, 新文件名) 序列，新文件名与原文件在同一目录
+    - 多个文件指向同一目标，或目标已存在且不会被移走时，相关文件记为冲突，不执行
+    - A→B、B→C 的链从链尾开始执行；A→B、B→A 的环先把其中一个文件移到临时文件名，最后再移到目标
+    返回:
+        {'units': [[(源路径, 目标路径), ...], ...], 'conflicts': [{'path', 'new_path', 'error'}], 'skipped': 无需改名的数量}
+        同一单元内的步骤必须按顺序执行，不同单元互不影响
+    """
+    moves = {}
+    targets = {}
+    skipped = 0
+    for file_path, new_name in renames:
+        new_path = os.path.join(os.path.dirname(file_path), new_name)
+        if new_path == file_path:
+            skipped += 1
+            continue
+        # 按 normcase 比较路径，大小写不敏感的文件系统上仅大小写不同的改名会形成自环
+        key = os.path.normcase(os.path.abspath(file_path))
+        target = os.path.normcase(os.path.abspath(new_path))
+        moves[key] = (file_path, new_path, target)
+        targets.setdefault(target, []).append(key)
+
+    conflicts = {}
+    for keys in targets.values():
+        if len(keys) > 1:
+            for key in keys:
+                conflicts[key] = '多个文件重命名为同一目标'
+    occupied = {target for target in targets if target not in moves and os.path.lexists(moves[targets[target][0]][1])}
+    # 冲突的文件留在原处又会占用别人的目标，重复检查直到没有新的冲突
+    changed = True
+    while changed:
+        changed = False
+        for key, (_, _, target) in moves.items():
+            if key not in conflicts and (target in occupied or target in conflicts):
+                conflicts[key] = '目标文件已存在'
+                changed = True
+
+    valid = {key: move for key, move in moves.items() if key not in conflicts}
+    incoming = {target: key for key, (_, _, target) in valid.items()}  # 目标路径 → 移入该路径的源文件
+    units = []
+    done = set()
+    for key, (_, _, target) in valid.items():
+        if target in valid:
+            continue  # 目标仍被占用，由链尾或环的处理带出
+        unit = []
+        current = key
+        while current is not None:
+            unit.append(valid[current][:2])
+            done.add(current)
+            current = incoming.get(current)
+        units.append(unit)
+    for key, (file_path, new_path, _) in valid.items():
+        if key in done:
+            continue
+        temp_path = _temp_rename_path(file_path)
+        unit = [(file_path, temp_path)]
+        done.add(key)
+        current = incoming[key]
+        while current != key:
+            unit.append(valid[current][:2])
+            done.add(current)
+            current = incoming[current]
+        unit.append((temp_path, new_path))
+        units.append(unit)
+
+    return {
+        'units': units,
+        'conflicts': [
+            {'path': moves[key][0], 'new_path': moves[key][1], 'error': error}
+            for key, error in conflicts.items()
+        ],
+        'skipped': skipped,
+    }
+
+def _unit_moves(unit: list) -> list:
+    """单元对应的 (原路径, 最终路径) 列表，环中经临时文件名中转的两步合并为一条"""
+    first, last = unit[0], unit[-1]
+    if len(unit) > 1 and first[1] == last[0]:
+        return unit[1:-1] + [(first[0], last[1])]
+    return unit
+
+_journal_counter = itertools.count()
+
+def rename_journal_dir() -> str:
+    """撤销日志目录：当前数据库文件（含 --db 指定的）所在目录下的 RENAME_JOURNAL_DIR"""
+    return os.path.join(os.path.dirname(database.path), RENAME_JOURNAL_DIR)
+
+def new_rename_journal(journal_dir: Optional[str] = None) -> str:
+    """
+    生成本次重命名的撤销日志路径，默认位于 rename_journal_dir()
+    文件名含微秒时间戳、进程号和进程内序号，同一秒内的多次重命名不会共用日志；按文件名排序即按时间排序
+    """
+    now = time.time()
+    name = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now % 1 * 1e6):06d}"
+            f"-{os.getpid()}-{next(_journal_counter):04d}.jsonl")
+    return os.path.join(journal_dir or rename_journal_dir(), name)
+
+def latest_rename_journal(journal_dir: Optional[str] = None) -> Optional[str]:
+    """最近一次重命名的撤销日志，没有时返回 None"""
+    journal_dir = journal_dir or rename_journal_dir()
+    try:
+        names = sorted(name for name in os.listdir(journal_dir) if name.endswith('.jsonl'))
+    except FileNotFoundError:
+        return None
+    return os.path.join(journal_dir, names[-1]) if names else None
+
+def execute_renames(plan: dict, journal_path: Optional[str] = None, max_workers: int = RENAME_WORKERS,
+                    cancel: Optional[threading.Event] = None, conn: Optional[sqlite3.Connection] = None) -> list:
+    """
+    执行 plan_renames 生成的计划：先把全部步骤写入撤销日志，再按目录并行执行（同一目录内按顺序），
+    每个单元结束后在日志中追加其状态（done / rolled_back / cancelled）
+    日志中保存绝对路径，在其他工作目录下撤销也能找到文件
+    传入 conn 时每个单元改名后在同一事务中同步数据库记录和探测缓存，写库失败则回滚该单元的改名，
+    conn 需以 check_same_thread=False 打开
+    单元中途失败时回滚该单元已完成的步骤，不会留下临时文件名；取消时已开始的单元会执行完
+    返回:
+        计划中每个文件的结果 [{'path', 'new_path', 'action', 'error'}]，action 为 renamed / failed / cancelled
+    """
+    results = [dict(conflict, action='failed') for conflict in plan['conflicts']]
+    units = plan['units']
+    if not units:
+        return results
+    journal = None
+    journal_lock = threading.Lock()
+    if journal_path:
+        os.makedirs(os.path.dirname(journal_path) or '.', exist_ok=True)
+        # 'x' 模式：日志已存在时报错，不会覆盖之前一次重命名的撤销记录
+        journal = open(journal_path, 'x', encoding='utf-8')
+        for n, unit in enumerate(units):
+            temps = {dst for src, dst in unit[:-1]} - {dst for src, dst in _unit_moves(unit)}
+            for src, dst in unit:
+                write_jsonl({'unit': n, 'src': os.path.abspath(src), 'dst': os.path.abspath(dst),
+                             'temp': src in temps}, journal)
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    db_lock = threading.Lock()
+    cache = ProbeCache(conn) if conn is not None else None
+
+    def sync(unit: list) -> None:
+        if conn is None:
+            return
+        with db_lock:
+            try:
+                sync_moved_files(_unit_moves(unit), conn)
+                for src, dst in unit:
+                    cache.move(src, dst)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+    def mark(n: int, status: str) -> None:
+        if journal is not None:
+            with journal_lock:
+                write_jsonl({'unit': n, 'status': status}, journal)
+                journal.flush()
+
+    by_directory = {}
+    for n, unit in enumerate(units):
+        by_directory.setdefault(os.path.dirname(unit[0][0]), []).append((n, unit))
+
+    def run_directory(directory_units: list) -> list:
+        out = []
+        for n, unit in directory_units:
+            moves = _unit_moves(unit)
+            if cancel is not None and cancel.is_set():
+                mark(n, 'cancelled')
+                out.extend({'path': src, 'new_path': dst, 'action': 'cancelled'} for src, dst in moves)
+                continue
+            completed = []
+            try:
+                for src, dst in unit:
+                    # 计划生成后目标可能被其他程序占用，os.rename 在 POSIX 上会直接覆盖
+                    if os.path.lexists(dst):
+                        raise FileExistsError(f"目标文件已存在: {dst}")
+                    os.rename(src, dst)
+                    completed.append((src, dst))
+                sync(unit)
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"重命名失败: {str(e)}")
+                for src, dst in reversed(completed):
+                    try:
+                        os.rename(dst, src)
+                    except OSError as rollback_error:
+                        logger.error(f"回滚重命名失败: {dst} → {src}: {rollback_error}")
+                mark(n, 'rolled_back')
+                out.extend({'path': src, 'new_path': dst, 'action': 'failed', 'error': str(e)} for src, dst in moves)
+            else:
+                mark(n, 'done')
+                for src, dst in moves:
+                    logger.info(f"{src}重命名为{dst}")
+                out.extend({'path': src, 'new_path': dst, 'action': 'renamed'} for src, dst in moves)
+        return out
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_directory)))) as executor:
+            for out in executor.map(run_directory, by_directory.values()):
+                results.extend(out)
+    finally:
+        if journal is not None:
+            journal.close()
+    return results
+
+def undo_renames(journal_path: str, conn: Optional[sqlite3.Connection] = None) -> tuple:
+    """
+    按撤销日志逆序恢复文件名，跳过已回滚、已取消和已撤销的单元，撤销后在日志中标记为 undone，重复撤销是安全的
+    没有状态的单元（执行中途程序退出）只恢复目标存在且原文件名未被占用的步骤
+    传入 conn 时每一步恢复后同步数据库记录和探测缓存
+    返回：(恢复的文件数, 失败的步骤数)
+    """
+    with open(journal_path, encoding='utf-8') as journal:
+        entries = [json.loads(line) for line in journal if line.strip()]
+    status = {entry['unit']: entry['status'] for entry in entries if 'status' in entry}
+    steps = [entry for entry in entries if 'src' in entry
+             and status.get(entry['unit']) not in ('rolled_back', 'cancelled', 'undone')]
+    cache = ProbeCache(conn) if conn is not None else None
+    restored = 0
+    failed = 0
+    for step in reversed(steps):
+        src, dst = step['src'], step['dst']
+        if not os.path.lexists(dst) or os.path.lexists(src):
+            continue
+        try:
+            os.rename(dst, src)
+        except OSError as e:
+            logger.error(f"撤销重命名失败: {str(e)}")
+            failed += 1
         else:
-            logger.info(f"{old_name}重命名为{new_name}")
-            success += 1
-            
-    msg.value = f"操作完成：成功 {success} 条，失败 {failure} 条"
+            logger.info(f"{dst}恢复为{src}")
+            if conn is not None:
+                try:
+                    sync_moved_files([(dst, src)], conn)
+                    cache.move(dst, src)
+                    conn.commit()
+                except sqlite3.Error as db_error:
+                    conn.rollback()
+                    logger.error(f"同步数据库失败: {dst} → {src}: {db_error}")
+            if not step.get('temp'):
+                restored += 1
+    with open(journal_path, 'a', encoding='utf-8') as journal:
+        for n in sorted({step['unit'] for step in steps}):
+            write_jsonl({'unit': n, 'status': 'undone'}, journal)
+    return restored, failed
+
+def rename(table: PagedTable, page: ft.Page, msg: ft.Text, logger,
+           cancel: Optional[threading.Event] = None) -> None:
+    """执行批量重命名操作：先生成完整计划并检查冲突，写入撤销日志后按目录并行执行，支持子目录中的文件"""
+    items = table.model.items
+    plan = plan_renames((item['path'], item['new_name']) for item in items)
+    for conflict in plan['conflicts']:
+        logger.error(f"重命名失败: {conflict['path']} → {conflict['new_path']}: {conflict['error']}")
+    with database.connection() as conn:
+        results = execute_renames(plan, new_rename_journal(), cancel=cancel, conn=conn)
+    # 同步表格中的路径和文件名，再次重命名时这些行会被跳过
+    by_path = {item['path']: item for item in items}
+    for result in results:
+        if result['action'] == 'renamed':
+            item = by_path[result['path']]
+            item['path'] = result['new_path']
+            item['filename'] = os.path.basename(result['new_path'])
+    actions = [result['action'] for result in results]
+    table.set_items(items, reset_page=False)
+    msg.value = f"操作完成：成功 {actions.count('renamed')} 条，失败 {actions.count('failed')} 条"
+    if actions.count('cancelled'):
+        msg.value += f"，取消 {actions.count('cancelled')} 条"
+    page.update()
+
+def undo_rename(table: PagedTable, page: ft.Page, msg: ft.Text) -> None:
+    """撤销最近一次重命名，撤销后需重新读取目录"""
+    journal_path = latest_rename_journal()
+    if journal_path is None:
+        msg.value = "没有可撤销的重命名"
+    else:
+        with database.connection() as conn:
+            restored, failed = undo_renames(journal_path, conn)
+        # 撤销过的日志改名保存，下次撤销更早的一次
+        os.replace(journal_path, journal_path + '.undone')
+        table.set_items([])
+        msg.value = f"撤销完成：恢复 {restored} 个文件名，失败 {failed} 条，请重新读取目录"
+    logger.info(msg.value)
     page.update()
 
+# 命令行入口 --------------------------------------------------
+def write_jsonl(record: dict, out=None) -> None:
+    """输出一行 JSON（JSON Lines 格式）"""
+    (out or sys.stdout).write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def cmd_scan(args) -> int:
+    """扫描目录并逐个输出视频元数据及是否已在数据库中；--import 时同时写入数据库"""
+    with database.connection() as conn:
+        cache = None if args.no_cache else ProbeCache(conn)
+        batch = []
+        failed = 0
+
+        def emit() -> None:
+            resolve_exists(batch, conn)
+            outcomes = {}
+            if args.write:
+                # 与界面默认勾选一致：不存在的记录和画质升级的记录；--update 时也更新其他已存在的记录
+                records = [item for item in batch if item['selected'] or (args.update and item['exists'])]
+                outcomes = dict(zip(map(id, records), upsert_videos(records, conn)))
+            for item in batch:
+                item.pop('selected', None)
+                if args.write:
+                    item['outcome'] = outcomes.get(id(item), 'skipped')
+                write_jsonl(item)
+            batch.clear()
+            conn.commit()
+            sys.stdout.flush()
+
+        def on_result(file_path: str, info: Optional[dict]) -> None:
+            nonlocal failed
+            if info is None:
+                failed += 1
+                write_jsonl({'path': file_path, 'error': '无法获取文件信息'})
+                return
+            batch.append(build_record(file_path, find_id(os.path.basename(file_path)), info))
+            if len(batch) >= SQL_IN_CHUNK:
+                emit()
+
+        files = profiler.iterate('walk', iter_video_files(args.directory, max_depth=args.max_depth,
+                                                          excludes=args.exclude))
+        probe_files(files, logger, cache, max_workers=args.workers, timeout=args.timeout,
+                    on_result=on_result, keep_results=False, fingerprint=not args.no_fingerprint)
+        emit()
+        if cache is not None:
+            cache.close()
+    return 1 if failed else 0
+
+def cmd_rename(args) -> int:
+    """按提取的电影ID规范化文件名：先生成完整计划并检查冲突，--dry-run 时只输出计划"""
+    files = iter_video_files(args.directory, max_depth=args.max_depth, excludes=args.exclude)
+    planned = {file_path: plan_new_name(os.path.basename(file_path)) for file_path in files}
+    plan = plan_renames((file_path, new_name) for file_path, (_, new_name) in planned.items() if new_name)
+    # 无法识别电影ID的文件不改名（没有人工确认，避免生成 原文件名+扩展名 这样的新文件名）
+    for file_path, (movie_id, _) in planned.items():
+        if movie_id is None:
+            write_jsonl({'path': file_path, 'action': 'skipped', 'error': '无法识别电影ID'})
+    if args.dry_run:
+        results = [dict(conflict, action='failed') for conflict in plan['conflicts']]
+        results.extend({'path': src, 'new_path': dst, 'action': 'plan'}
+                       for unit in plan['units'] for src, dst in _unit_moves(unit))
+    else:
+        with database.connection() as conn:
+            results = execute_renames(plan, args.journal or new_rename_journal(), max_workers=args.workers,
+                                      conn=conn)
+    for result in results:
+        write_jsonl(dict(result, id=planned[result['path']][0]))
+    return 1 if any(result['action'] == 'failed' for result in results) else 0
+
+def cmd_undo_rename(args) -> int:
+    """按撤销日志恢复重命名，默认撤销最近一次"""
+    journal_path = args.journal or latest_rename_journal()
+    if journal_path is None:
+        logger.error("没有可撤销的重命名")
+        return 1
+    with database.connection() as conn:
+        restored, failed = undo_renames(journal_path, conn)
+    if not args.journal:
+        os.replace(journal_path, journal_path + '.undone')
+    write_jsonl({'journal': journal_path, 'restored': restored, 'failed': failed})
+    return 1 if failed else 0
+
+def cmd_search(args) -> int:
+    """检索数据库，逐条输出当前页记录，最后输出一行命中总数和分面统计"""
+    filters = {'studio': args.studio, 'codec': args.codec, 'res_class': args.res, 'chs': args.chs,
+               'size_min': args.size_min * 1024 * 1024 if args.size_min is not None else None,
+               'size_max': args.size_max * 1024 * 1024 if args.size_max is not None else None,
+               'duration_min': args.duration_min * 60 if args.duration_min is not None else None,
+               'duration_max': args.duration_max * 60 if args.duration_max is not None else None}
+    with database.connection() as conn:
+        result = search_videos(conn, ' '.join(args.text), filters, args.page - 1, args.page_size,
+                               args.order, not args.desc)
+    for item in result['items']:
+        write_jsonl(item)
+    write_jsonl({'total': result['total'], 'page': args.page,
+                 'pages': max(1, math.ceil(result['total'] / args.page_size)), 'facets': result['facets']})
+    return 0
+
+def cmd_report(args) -> int:
+    """输出统计报表：total 为全库汇总，其余按 REPORT_TYPES 分组或列出转码候选，逐行写出"""
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        with database.connection() as conn:
+            if args.report == 'total':
+                export_report([library_totals(conn)], ('count', 'size', 'duration'), out, args.format)
+            else:
+                columns, rows = report_rows(conn, args.report, args.codec or REENCODE_CODECS,
+                                            int(args.min_bitrate * 1000 * 1000))
+                count = export_report(rows, columns, out, args.format)
+                logger.info("报表 %s 输出 %d 行", args.report, count)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def cmd_bench_ids(args) -> int:
+    """评估ID提取规则的准确率和速度"""
+    write_jsonl(benchmark_id_extraction(args.corpus, args.rounds))
+    return 0
+
+def cmd_bench_probe(args) -> int:
+    """
+    对比文件头解析与 ffprobe 的单文件耗时，可分别在本地盘和网络盘目录上运行
+    两种方式交替先后顺序，减少系统文件缓存带来的偏差
+    """
+    header_ms = []
+    ffprobe_ms = []
+    header_hits = 0
+    files = itertools.islice(iter_video_files(args.directory, max_depth=args.max_depth, excludes=args.exclude), args.limit)
+    for index, file_path in enumerate(files):
+        timings = {}
+        for method in (('header', 'ffprobe') if index % 2 == 0 else ('ffprobe', 'header')):
+            start = time.perf_counter()
+            if method == 'header':
+                info = read_header_info(file_path)
+            else:
+                try:
+                    run_ffprobe(file_path, args.timeout)
+                except (ffmpeg.Error, subprocess.TimeoutExpired, ValueError, FileNotFoundError) as e:
+                    logger.error("FFmpeg探测错误: %s %s", file_path, str(e))
+            timings[method] = (time.perf_counter() - start) * 1000
+        header_ms.append(timings['header'])
+        ffprobe_ms.append(timings['ffprobe'])
+        header_hits += info is not None
+        write_jsonl({'path': file_path, 'header_ok': info is not None,
+                     'header_ms': round(timings['header'], 3), 'ffprobe_ms': round(timings['ffprobe'], 3)})
+    if header_ms:
+        write_jsonl({
+            'files': len(header_ms),
+            'header_hits': header_hits,
+            'header_p50_ms': round(statistics.median(header_ms), 3),
+            'header_mean_ms': round(statistics.fmean(header_ms), 3),
+            'ffprobe_p50_ms': round(statistics.median(ffprobe_ms), 3),
+            'ffprobe_mean_ms': round(statistics.fmean(ffprobe_ms), 3),
+            'speedup': round(statistics.fmean(ffprobe_ms) / max(statistics.fmean(header_ms), 1e-9), 1),
+        })
+    return 0
+
+def _bench_template(template_dir: str, container: str, codec: str, width: int, height: int,
+                    duration: float) -> str:
+    """用 ffmpeg 的 lavfi 测试图源生成一个模板视频（已存在则直接复用），MP4 把 moov 放在文件头"""
+    path = os.path.join(template_dir, f"{codec}_{width}x{height}_{duration:g}s.{container}")
+    if not os.path.exists(path):
+        options = {'movflags': '+faststart'} if container == 'mp4' else {}
+        (ffmpeg
+         .input(f"testsrc2=size={width}x{height}:rate=25:duration={duration:g}", f='lavfi')
+         .output(path + '.part', vcodec=codec, pix_fmt='yuv420p', f='mp4' if container == 'mp4' else 'matroska',
+                 **options)
+         .overwrite_output()
+         .run(quiet=True))
+        os.replace(path + '.part', path)
+    return path
+
+def _bench_padding(container: str, data: bytes) -> bytes:
+    """
+    追加在模板末尾的填充，使每个文件的大小和内容指纹都不同且仍是合法的容器：
+    MP4 为 free 盒子，MKV 为 EBML Void 元素（8 字节长度）
+    """
+    if container == 'mp4':
+        return struct.pack('>I', 8 + len(data)) + b'free' + data
+    return b'\xec' + ((1 << 56) | len(data)).to_bytes(8, 'big') + data
+
+def make_bench_tree(directory: str, files: int = 200, depth: int = 2, seed: int = 0,
+                    duration: float = 2.0) -> bool:
+    """
+    在 directory 下生成可复现的基准测试目录树：
+    - 每种 BENCH_TEMPLATES 模板用 ffmpeg 生成一次，保存在 BENCH_DIR 中
+    - 每个文件复制一个模板并追加随机填充，文件名按 BENCH_NAME_STYLES 加入常见噪声，随机分布在最多 depth 层子目录中
+    相同参数再次调用时直接复用已有目录树；参数不同时只删除上次生成的文件后重新生成
+    返回：是否重新生成了文件
+    """
+    bench_dir = os.path.join(directory, BENCH_DIR)
+    manifest_path = os.path.join(bench_dir, 'manifest.json')
+    params = {'files': files, 'depth': depth, 'seed': seed, 'duration': duration}
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['params'] == params:
+            return False
+    elif os.path.isdir(directory) and set(os.listdir(directory)) - {BENCH_DIR}:
+        raise ValueError(f"目录不为空且不是基准测试目录: {directory}")
+    if manifest is not None:
+        for rel_path in manifest['files']:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, rel_path))
+    os.makedirs(bench_dir, exist_ok=True)
+    templates = [(container, _bench_template(bench_dir, container, codec, width, height, duration))
+                 for container, codec, width, height in BENCH_TEMPLATES]
+    rng = random.Random(seed)
+    generated = []
+    for index in range(files):
+        container, template = rng.choice(templates)
+        name = rng.choice(BENCH_NAME_STYLES).format(studio=BENCH_STUDIOS[index % len(BENCH_STUDIOS)],
+                                                    number=index // len(BENCH_STUDIOS) + 1)
+        subdirs = [f"dir{rng.randrange(4)}" for _ in range(rng.randint(0, depth))]
+        rel_path = os.path.join(*subdirs, f"{name}.{container}")
+        target = os.path.join(directory, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(template, target)
+        with open(target, 'ab') as f:
+            f.write(_bench_padding(container, rng.randbytes(rng.randrange(1, 64) * 1024)))
+        generated.append(rel_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'params': params, 'files': generated}, f, ensure_ascii=False)
+    logger.info("已生成基准测试目录 %s：%d 个文件", directory, files)
+    return True
+
+def cmd_bench_tree(args) -> int:
+    """
+    生成（或复用）基准测试目录树，然后开启性能统计，用与 import 命令相同的流程扫描并写入
+    目录内单独的 bench.db；默认先删除 bench.db，即不使用探测缓存的冷启动扫描，--warm 时保留
+    最后输出一行性能统计汇总，同一参数多次运行的结果可直接对比
+    """
+    try:
+        generated = make_bench_tree(args.directory, args.files, args.depth, args.seed, args.duration)
+    except (ValueError, OSError, ffmpeg.Error) as e:
+        logger.error("生成基准测试目录失败: %s", str(e))
+        return 1
+    if args.no_scan:
+        write_jsonl({'directory': args.directory, 'files': args.files, 'generated': generated})
+        return 0
+    bench_db = os.path.join(args.directory, BENCH_DIR, 'bench.db')
+    if not args.warm:
+        for suffix in ('', '-wal', '-shm'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(bench_db + suffix)
+    database.set_path(bench_db)
+    profiler.enable(args.metrics_file)
+    scan_args = argparse.Namespace(directory=args.directory, max_depth=None, exclude=[BENCH_DIR],
+                                   workers=args.workers, timeout=args.timeout, no_cache=False,
+                                   no_fingerprint=False, write=True, update=False)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), profiler.run('bench-tree'):
+        failed = cmd_scan(scan_args)
+    write_jsonl(profiler.last_summary)
+    return failed
+
+def run_cli(argv: Optional[list] = None) -> int:
+    """无界面命令行入口，结果以 JSON Lines 输出到标准输出"""
+    parser = argparse.ArgumentParser(prog='ft.py', description='视频文件整理工具（命令行模式）')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径（默认为程序所在目录下的 avid.db）')
+    parser.add_argument('--log-file', default='avid.log', help='日志文件路径，传空字符串则不写日志文件')
+    parser.add_argument('--profile', action='store_true', help='统计各阶段耗时，结束时把汇总写入日志')
+    parser.add_argument('--metrics-file', default=None, help='性能统计汇总写入该文件（JSON Lines），隐含 --profile')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_walk_arguments(sub) -> None:
+        sub.add_argument('directory', help='要处理的目录')
+        sub.add_argument('--max-depth', type=int, default=None, help='最大递归深度')
+        sub.add_argument('--exclude', action='append', default=[], help='跳过的文件/目录名通配符，可重复')
+
+    def add_probe_arguments(sub) -> None:
+        sub.add_argument('--workers', type=int, default=PROBE_WORKERS, help='并行探测线程数')
+        sub.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help='单个文件探测超时（秒）')
+        sub.add_argument('--no-cache', action='store_true', help='不使用探测缓存')
+        sub.add_argument('--no-fingerprint', action='store_true', help='不计算内容指纹（不检查重复文件）')
+
+    scan = subparsers.add_parser('scan', help='扫描目录并输出视频信息')
+    add_walk_arguments(scan)
+    add_probe_arguments(scan)
+    scan.set_defaults(func=cmd_scan, write=False, update=False)
+
+    rename_parser = subparsers.add_parser('rename', help='规范化文件名')
+    add_walk_arguments(rename_parser)
+    rename_parser.add_argument('--dry-run', action='store_true', help='只输出重命名计划，不修改文件')
+    rename_parser.add_argument('--workers', type=int, default=RENAME_WORKERS, help='并行重命名的目录数')
+    rename_parser.add_argument('--journal', default=None, help=f'撤销日志路径，默认在数据库所在目录的 {RENAME_JOURNAL_DIR} 目录下自动生成')
+    rename_parser.set_defaults(func=cmd_rename)
+
+    undo_parser = subparsers.add_parser('undo-rename', help='撤销重命名')
+    undo_parser.add_argument('journal', nargs='?', default=None, help='撤销日志路径，默认为最近一次重命名')
+    undo_parser.set_defaults(func=cmd_undo_rename)
+
+    import_parser = subparsers.add_parser('import', help='扫描目录并写入数据库')
+    add_walk_arguments(import_parser)
+    add_probe_arguments(import_parser)
+    import_parser.add_argument('--update', action='store_true', help='同时更新数据库中已存在的记录（默认只替换画质升级的记录）')
+    import_parser.set_defaults(func=cmd_scan, write=True)
+
+    search = subparsers.add_parser('search', help='按ID/文件名及分面条件检索数据库')
+    search.add_argument('text', nargs='*', help='检索词，对ID和文件名做前缀匹配')
+    search.add_argument('--studio', action='append', help='片商前缀，可重复')
+    search.add_argument('--codec', action='append', help='视频编码，可重复')
+    search.add_argument('--res', action='append', choices=['2160p', '1080p', '720p', 'SD'], help='分辨率等级，可重复')
+    search.add_argument('--chs', action='store_const', const=True, default=None, help='只看有中文字幕的')
+    search.add_argument('--no-chs', dest='chs', action='store_const', const=False, help='只看没有中文字幕的')
+    search.add_argument('--size-min', type=float, default=None, help='最小文件大小（MB）')
+    search.add_argument('--size-max', type=float, default=None, help='最大文件大小（MB）')
+    search.add_argument('--duration-min', type=float, default=None, help='最短时长（分钟）')
+    search.add_argument('--duration-max', type=float, default=None, help='最长时长（分钟）')
+    search.add_argument('--order', choices=sorted(SEARCH_ORDERS), default='id', help='排序字段')
+    search.add_argument('--desc', action='store_true', help='降序排列')
+    search.add_argument('--page', type=int, default=1, help='页码（从1开始）')
+    search.add_argument('--page-size', type=int, default=PAGE_SIZE, help='每页条数')
+    search.set_defaults(func=cmd_search)
+
+    report = subparsers.add_parser('report', help='统计报表（按片商/编码/分辨率汇总、转码候选）')
+    report.add_argument('report', choices=['total', *REPORT_TYPES], help='报表类型')
+    report.add_argument('--format', choices=['jsonl', 'csv', 'json'], default='jsonl', help='输出格式')
+    report.add_argument('--output', default=None, help='输出文件路径，默认输出到标准输出')
+    report.add_argument('--codec', action='append', help=f'转码候选的视频编码，可重复，默认 {",".join(REENCODE_CODECS)}')
+    report.add_argument('--min-bitrate', type=float, default=REENCODE_MIN_BITRATE / 1000 / 1000,
+                        help='转码候选的最低码率（Mbps）')
+    report.set_defaults(func=cmd_report)
+
+    bench = subparsers.add_parser('bench-ids', help='评估ID提取规则')
+    bench.add_argument('--corpus', default=ID_CORPUS_PATH, help='语料文件路径')
+    bench.add_argument('--rounds', type=int, default=1000, help='重复次数')
+    bench.set_defaults(func=cmd_bench_ids)
+
+    bench_probe = subparsers.add_parser('bench-probe', help='对比文件头解析与 ffprobe 的耗时')
+    add_walk_arguments(bench_probe)
+    bench_probe.add_argument('--limit', type=int, default=200, help='最多测试的文件数')
+    bench_probe.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help='单个文件探测超时（秒）')
+    bench_probe.set_defaults(func=cmd_bench_probe)
+
+    bench_tree = subparsers.add_parser('bench-tree', help='生成基准测试目录树并统计扫描各阶段耗时（需要 ffmpeg）')
+    bench_tree.add_argument('directory', help='基准测试目录（不存在时自动创建）')
+    bench_tree.add_argument('--files', type=int, default=200, help='文件数')
+    bench_tree.add_argument('--depth', type=int, default=2, help='最大子目录层数')
+    bench_tree.add_argument('--seed', type=int, default=0, help='随机种子，相同参数生成相同的目录树')
+    bench_tree.add_argument('--duration', type=float, default=2.0, help='模板视频时长（秒）')
+    bench_tree.add_argument('--workers', type=int, default=PROBE_WORKERS, help='并行探测线程数')
+    bench_tree.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help='单个文件探测超时（秒）')
+    bench_tree.add_argument('--warm', action='store_true', help='保留上次的 bench.db（使用探测缓存）')
+    bench_tree.add_argument('--no-scan', action='store_true', help='只生成目录树，不扫描')
+    bench_tree.set_defaults(func=cmd_bench_tree, own_profile=True)
+
+    args = parser.parse_args(argv)
+    setup_logging(args.log_file or None)
+    database.set_path(args.db)
+    if args.profile or args.metrics_file:
+        profiler.enable(args.metrics_file)
+    try:
+        # bench-tree 自己划定统计范围（不包括生成目录树的时间）
+        with contextlib.nullcontext() if getattr(args, 'own_profile', False) else profiler.run(args.command):
+            return args.func(args)
+    finally:
+        database.close()
+
 def main(page: ft.Page):
     """
     主函数。
@@ -438,6 +3201,9 @@ def main(page: ft.Page):
         "微软雅黑": "Microsoft YaHei"
     }
     page.theme = ft.Theme(font_family="微软雅黑")
+    # 开启性能统计时记录界面同步（page.update）的次数和耗时
+    if profiler.enabled:
+        page.update = profiler.wrap('ui.update', page.update)
     rename_txt_path = ft.TextField(label="选择路径", read_only=True, expand=True)
     query_txt_path = ft.TextField(label="选择路径", read_only=True, expand=True)
     rename_path = r''
@@ -491,17 +3257,138 @@ def main(page: ft.Page):
         divider_thickness=0
     )
 
+    # 分页表格：数据保存在模型中，只渲染当前页
+    rename_table = PagedTable(rename_data_table, page, lambda item, sn: build_rename_row(item, sn, page),
+                              [None, 'filename', 'id', 'new_name', 'size', 'format'])
+    query_table = PagedTable(query_data_table, page, lambda item, sn: build_query_row(item, sn, page),
+                             [None, 'filename', 'id', 'size', 'width', 'duration', 'codec', 'bitrate', 'chs', 'exists'])
+
+    search_data_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("序号"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("电影ID"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("文件名"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("文件大小"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("分辨率"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("时长"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("视频编码"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("视频码率(Kbps)"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("中文字幕"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("路径"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+        ],
+        rows=[],
+    )
+    # 检索面板：分面下拉框显示当前条件下各取值的数量，每次查询后刷新
+    facet_dropdowns = {
+        facet: ft.Dropdown(label=label, width=150, options=facet_options(facet, []),
+                           on_change=lambda _: run_search())
+        for facet, label in (('studio', "片商"), ('codec', "视频编码"), ('res_class', "分辨率"), ('chs', "中文字幕"))
+    }
+    range_fields = {
+        key: ft.TextField(label=label, width=120)
+        for key, label in (('size_min', "最小(MB)"), ('size_max', "最大(MB)"),
+                           ('duration_min', "最短(分钟)"), ('duration_max', "最长(分钟)"))
+    }
+
+    def run_search() -> None:
+        search_table.model.set_filters(read_search_filters(facet_dropdowns, range_fields))
+        search_table.render()
+
+    def update_facets(result: dict) -> None:
+        for facet, dropdown in facet_dropdowns.items():
+            dropdown.options = facet_options(facet, result['facets'].get(facet, []))
+
+    search_table = PagedTable(search_data_table, page, build_search_row,
+                              [None, 'id', None, 'size', 'width', 'duration', 'codec', 'bitrate', 'chs', None],
+                              SearchModel(on_refresh=update_facets))
+    search_table.filter_field.label = "检索ID/文件名"
+
+    report_data_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("序号"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("分组"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("文件数"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("总大小"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("总时长"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("平均码率(Kbps)"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("容量占比"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+        ],
+        rows=[],
+    )
+    reencode_data_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("序号"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("电影ID"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("文件名"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("文件大小"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("分辨率"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("视频编码"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("视频码率(Kbps)"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("预计节省"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+            ft.DataColumn(ft.Text("路径"),heading_row_alignment=ft.CrossAxisAlignment.CENTER),
+        ],
+        rows=[],
+    )
+    report_table = PagedTable(report_data_table, page, build_report_row,
+                              [None, 'key', 'count', 'size', 'duration', 'bitrate', 'share'],
+                              ResultModel(filter_keys=('key',)))
+    reencode_table = PagedTable(reencode_data_table, page, build_reencode_row,
+                                [None, 'id', 'filename', 'size', 'width', 'codec', 'bitrate', 'saving', None])
+    # 统计面板：分组统计与转码候选的列不同，各用一个表格，按所选报表切换显示
+    report_type = ft.Dropdown(label="报表", width=150, value='studio',
+                              options=[ft.dropdown.Option(key=key, text=text) for key, text in REPORT_TYPES.items()])
+    min_bitrate_field = ft.TextField(label="转码候选最低码率(Mbps)", width=200,
+                                     value=f"{REENCODE_MIN_BITRATE / 1000 / 1000:g}")
+    export_path = ft.TextField(label="导出文件（.csv/.json/.jsonl）", width=300, value='report.csv')
+    report_view = ft.Container(ft.ListView([report_data_table], expand=True, auto_scroll=False), padding=10, expand=True)
+    reencode_view = ft.Container(ft.ListView([reencode_data_table], expand=True, auto_scroll=False), padding=10,
+                                 expand=True, visible=False)
+    reencode_table.controls.visible = False
+
+    def read_min_bitrate() -> int:
+        try:
+            return int(float(min_bitrate_field.value) * 1000 * 1000)
+        except (TypeError, ValueError):
+            return REENCODE_MIN_BITRATE
+
+    def run_report() -> None:
+        reencode = report_type.value == 'reencode'
+        report_view.visible = report_table.controls.visible = not reencode
+        reencode_view.visible = reencode_table.controls.visible = reencode
+        report_read(report_type.value, reencode_table if reencode else report_table, page, show_message,
+                    read_min_bitrate())
+
+    def notify(text: str) -> None:
+        show_message.value = text
+        page.update()
+
+    # 扫描、重命名、写库都在后台线程运行，每个表格同时只允许一个任务
+    jobs = JobRunner(notify)
+
     # 创建一个提升型按钮用于选择要重命名的文件夹
     btn_rename_folder = ft.ElevatedButton("选择文件夹", on_click=lambda _: rename_picker.get_directory_path())
     # 创建一个提升型按钮用于选择要查询的文件夹
     btn_query_folder = ft.ElevatedButton("选择文件夹", on_click=lambda _: query_picker.get_directory_path())
     # 创建一个提升型按钮，用于读取重命名操作的相关数据
-    btn_rename_read = ft.ElevatedButton("读取", on_click=lambda _: rename_read(rename_txt_path.value, rename_data_table, page,show_message))
+    btn_rename_read = ft.ElevatedButton("读取", on_click=lambda _: jobs.submit('rename', "读取", lambda job: rename_read(rename_txt_path.value, rename_table, page,show_message, cancel=job.cancel_event)))
     # 创建一个提升型按钮，用于读取查询操作的相关数据
-    btn_query_read = ft.ElevatedButton("读取", on_click=lambda _: query_read(query_txt_path.value, query_data_table, page,show_message))
+    btn_query_read = ft.ElevatedButton("读取", on_click=lambda _: jobs.submit('query', "读取", lambda job: query_read(query_txt_path.value, query_table, page,show_message, cancel=job.cancel_event)))
+    # 增量刷新按钮，只处理上次读取后变化的文件
+    btn_rename_refresh = ft.ElevatedButton("增量刷新", on_click=lambda _: jobs.submit('rename', "增量刷新", lambda job: rename_read(rename_txt_path.value, rename_table, page,show_message, incremental=True, cancel=job.cancel_event)))
+    btn_query_refresh = ft.ElevatedButton("增量刷新", on_click=lambda _: jobs.submit('query', "增量刷新", lambda job: query_read(query_txt_path.value, query_table, page,show_message, incremental=True, cancel=job.cancel_event)))
     # 创建一个提升型按钮，用于执行重命名操作
-    btn_rename = ft.ElevatedButton("重命名", on_click=lambda _: rename(rename_data_table, rename_txt_path, page,show_message,logger))
-    btn_store_database = ft.ElevatedButton("写入数据库", on_click=lambda _: write_db(query_data_table, page,show_message,logger))
+    btn_rename = ft.ElevatedButton("重命名", on_click=lambda _: jobs.submit('rename', "重命名", lambda job: rename(rename_table, page,show_message,logger, cancel=job.cancel_event)))
+    # 撤销最近一次重命名
+    btn_rename_undo = ft.ElevatedButton("撤销重命名", on_click=lambda _: jobs.submit('rename', "撤销重命名", lambda job: undo_rename(rename_table, page, show_message)))
+    btn_store_database = ft.ElevatedButton("写入数据库", on_click=lambda _: jobs.submit('query', "写入数据库", lambda job: write_db(query_table, page,show_message,logger)))
+    # 停止当前表格上正在运行的任务
+    btn_rename_stop = ft.ElevatedButton("停止", on_click=lambda _: jobs.cancel('rename'))
+    btn_query_stop = ft.ElevatedButton("停止", on_click=lambda _: jobs.cancel('query'))
+    # 按检索面板的条件查询数据库
+    btn_search = ft.ElevatedButton("检索", on_click=lambda _: jobs.submit('search', "检索", lambda job: run_search()))
+    # 统计报表及导出（导出直接从数据库逐行写文件，不经过表格）
+    btn_report = ft.ElevatedButton("统计", on_click=lambda _: jobs.submit('report', "统计", lambda job: run_report()))
+    btn_report_export = ft.ElevatedButton("导出", on_click=lambda _: jobs.submit('report', "导出", lambda job: report_export(report_type.value, export_path.value, page, show_message, read_min_bitrate())))
     tab = ft.Tabs(
         selected_index=0,
         animation_duration=300,
@@ -513,17 +3400,18 @@ def main(page: ft.Page):
                         ft.Text("文件重命名", size=24)]
                         ),
                     ft.Row(
-                        [rename_txt_path, btn_rename_folder, btn_rename_read, btn_rename], 
+                        [rename_txt_path, btn_rename_folder, btn_rename_read, btn_rename_refresh, btn_rename, btn_rename_undo, btn_rename_stop], 
                         alignment=ft.MainAxisAlignment.CENTER),
                     ft.Container(
                         ft.ListView(
                             [rename_data_table],
                             expand=True,
-                            auto_scroll=True
+                            auto_scroll=False
                         ),
                         padding=10,
                         expand=True
                     ),
+                    rename_table.controls,
                 ])
             ),
             ft.Tab(
@@ -531,17 +3419,50 @@ def main(page: ft.Page):
                 content=ft.Column([
                     ft.Text("数据查询", size=24),
                     ft.Row(
-                        [query_txt_path, btn_query_folder, btn_query_read, btn_store_database],
+                        [query_txt_path, btn_query_folder, btn_query_read, btn_query_refresh, btn_store_database, btn_query_stop],
                         alignment=ft.MainAxisAlignment.CENTER),
                     ft.Container(
                         ft.ListView(
                             [query_data_table],
                             expand=True,
-                            auto_scroll=True
+                            auto_scroll=False
+                        ),
+                        padding=10,
+                        expand=True
+                    ),
+                    query_table.controls,
+                ]),
+            ),
+            ft.Tab(
+                text="检索",
+                content=ft.Column([
+                    ft.Text("数据检索", size=24),
+                    ft.Row(
+                        [*facet_dropdowns.values(), *range_fields.values(), btn_search],
+                        alignment=ft.MainAxisAlignment.CENTER),
+                    ft.Container(
+                        ft.ListView(
+                            [search_data_table],
+                            expand=True,
+                            auto_scroll=False
                         ),
                         padding=10,
                         expand=True
                     ),
+                    search_table.controls,
+                ]),
+            ),
+            ft.Tab(
+                text="统计",
+                content=ft.Column([
+                    ft.Text("数据统计", size=24),
+                    ft.Row(
+                        [report_type, min_bitrate_field, btn_report, export_path, btn_report_export],
+                        alignment=ft.MainAxisAlignment.CENTER),
+                    report_view,
+                    reencode_view,
+                    report_table.controls,
+                    reencode_table.controls,
                 ]),
             ),
         ],
@@ -551,4 +3472,12 @@ def main(page: ft.Page):
              ft.Container(show_message, alignment=ft.alignment.center)
              )
 
-ft.app(target=main)
\ No newline at end of file
+if __name__ == '__main__':
+    # 带参数运行时使用命令行模式，否则启动界面
+    if len(sys.argv) > 1:
+        sys.exit(run_cli())
+    setup_logging()
+    # 界面模式通过环境变量开启性能统计：AVID_PROFILE=1 写入日志，其他值作为指标文件路径
+    if os.environ.get(PROFILE_ENV):
+        profiler.enable(None if os.environ[PROFILE_ENV] == '1' else os.environ[PROFILE_ENV])
+    ft.app(target=main)
@@ -0,0 +1,29 @@
+# ID提取准确率测试：逐条核对 id_corpus.tsv 语料，并用 pytest-benchmark 测量批量提取速度
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ft  # noqa: E402
+
+
+def load_corpus(path: str = ft.ID_CORPUS_PATH) -> list:
+    """读取语料（每行: 文件名<TAB>期望ID，# 开头为注释），返回 [(文件名, 期望ID)]"""
+    with open(path, encoding='utf-8') as f:
+        return [tuple(line.rstrip('\n').split('\t')) for line in f if line.strip() and not line.startswith('#')]
+
+
+CORPUS = load_corpus()
+
+
+@pytest.mark.parametrize('name, expected', CORPUS, ids=[name for name, _ in CORPUS])
+def test_find_id(name, expected):
+    assert ft.find_id(name) == expected
+
+
+def test_extract_ids_benchmark(benchmark):
+    names = [name for name, _ in CORPUS]
+    results = benchmark(ft.extract_ids, names)
+    assert results == [expected for _, expected in CORPUS]